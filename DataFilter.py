@@ -1,19 +1,41 @@
 import csv
-import re
+import numpy as np
 import pandas as pd
-import urllib.parse
 import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from pattern_matcher import PatternMatcher
+from rule_profiler import RuleProfiler
+from url_normalizer import SHARED_HOSTS, normalize_urls
+from near_duplicates import UnionFind, minhash_signatures, near_duplicate_pairs
+from table_io import TableWriter, iter_table, read_table, write_table
+
+class SeenUrls:
+    """Компактное множество уже встреченных адресов: 8 байт на адрес (64-битный хеш)"""
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def check_and_add(self, urls: pd.Series) -> np.ndarray:
+        """Отмечает адреса, встреченные раньше, и запоминает новые"""
+        hashes = pd.util.hash_pandas_object(urls, index=False).to_numpy()
+        seen = np.isin(hashes, self.hashes)
+        self.hashes = np.union1d(self.hashes, hashes[~seen])
+        return seen
 
 class DataFilter:
-    def __init__(self, df: pd.DataFrame = None, red_flags: object = {}, csv_path: str = None, locale: str = None, green_flags: object = {}):
-        self.df = pd.DataFrame()
-        if df is not None:
-            self.df = df
-        elif csv_path is not None:
-            self.df = pd.read_csv(csv_path, sep="|")
-
-        self.removed = pd.DataFrame(columns=self.df.columns)
+    def __init__(self, df: pd.DataFrame = None, red_flags: object = {}, csv_path: str = None, locale: str = None, green_flags: object = {}, columns: list = None, profile: bool = False):
+        # csv_path может указывать и на .parquet/.feather, columns ограничивает читаемые столбцы
+        # profile=True собирает статистику по каждому шаблону red flags, см. pattern_report
+        if df is None:
+            df = read_table(csv_path, columns=columns) if csv_path is not None else pd.DataFrame()
+        self._set_frame(df)
+        self.seen_urls = None
         self.locale = locale
+        self.profiler = RuleProfiler() if profile else None
 
         self.bad_domains = [
             r"\b(?:google|yandex|bing|mail|yahoo|facebook|instagram|threads)\b",
@@ -26,6 +48,9 @@ class DataFilter:
             r"\b(?:(files|docs|images|media|static|cdn|assets|content|download|archive|backup|storage)\.(?:ru|ua|com))\b",
         ]
 
+        # Точные регистрируемые домены, проверяются поиском по множеству, а не регуляркой
+        self.blocked_domains = set()
+
         self.bad_title = [
             r"\b(страница\s+не\s+найдена|404|ошибка|доступ\s+запрещён|not\s+found)\b",
             r"\b(карта\s+сайта|site\s+map)\b",
@@ -39,9 +64,17 @@ class DataFilter:
         ]
 
         self._add_filters_from_red_flags(red_flags)
+        self.green_flags = green_flags
         self._compile_regex_patterns()
         self.logger = self._setup_logger()
-        self.green_flags = green_flags
+
+    def _set_frame(self, df: pd.DataFrame):
+        self.df = df
+        # Исходный кадр не изменяется: удалённые строки восстанавливаются из него по позициям
+        self._source = df
+        self._positions = np.arange(len(df))
+        self._removal_reasons = []
+        self._removed_reason = np.full(len(df), -1, dtype=np.int32)
 
     def _add_filters_from_red_flags(self, red_flags):
         mapping = {
@@ -58,10 +91,33 @@ class DataFilter:
                 elif isinstance(value, str):
                     target_list.append(value)
 
+        domains = red_flags.get("domain")
+        if domains:
+            if isinstance(domains, str):
+                domains = [domains]
+            self.blocked_domains.update(domain.lower() for domain in domains)
+
     def _compile_regex_patterns(self):
-        self.domain_pattern = re.compile('|'.join(self.bad_domains), re.IGNORECASE)
-        self.title_pattern = re.compile('|'.join(self.bad_title), re.IGNORECASE)
-        self.description_pattern = re.compile('|'.join(self.bad_description), re.IGNORECASE)
+        self.domain_matcher = PatternMatcher(self.bad_domains)
+        self.title_matcher = PatternMatcher(self.bad_title)
+        self.description_matcher = PatternMatcher(self.bad_description)
+        self.green_matchers = {column: PatternMatcher(patterns) for column, patterns in self.green_flags.items()}
+
+    def _worker_config(self) -> dict:
+        """Итоговые наборы правил для сборки такого же фильтра в процессе-обработчике"""
+        return {
+            "locale": self.locale,
+            "green_flags": self.green_flags,
+            "bad_domains": self.bad_domains,
+            "blocked_domains": self.blocked_domains,
+            "bad_title": self.bad_title,
+            "bad_description": self.bad_description,
+            "profile": self.profiler is not None,
+        }
+
+    @staticmethod
+    def _first_matches(series: pd.Series, matcher: PatternMatcher) -> np.ndarray:
+        return np.asarray(matcher.first_matches(series.to_numpy()), dtype=np.int64)
 
     def _setup_logger(self):
         logger = logging.getLogger('DataFilter')
@@ -75,99 +131,201 @@ class DataFilter:
 
         return logger
 
-    def _log_removed(self, original_df):
-        removed = pd.concat([original_df, self.df]).drop_duplicates(keep=False)
-        self.removed = pd.concat([self.removed, removed])
-
-    def __clean_url(self, url: str) -> str:
-        if not isinstance(url, str):
-            return ""
-        url = urllib.parse.unquote(url.strip().lower())
-        parsed = urllib.parse.urlparse(url)
-
-        # Пропускаем невалидные схемы
-        if parsed.scheme not in ("http", "https") or not parsed.netloc:
-            return ""
-
-        cleaned_url = urllib.parse.urlunparse((
-            parsed.scheme,
-            parsed.netloc.replace("www.", ""),
-            parsed.path.rstrip("/"),
-            '', '', ''
-        ))
-        cleaned_url = re.sub(r"\s+", "", cleaned_url)
-        cleaned_url = re.sub(r"[\u200B-\u200D\uFEFF]", "", cleaned_url)
-        return cleaned_url
+    def _reason_id(self, stage: str, pattern: str = "") -> int:
+        reason = (stage, pattern)
+        if reason not in self._removal_reasons:
+            self._removal_reasons.append(reason)
+        return self._removal_reasons.index(reason)
+
+    def _mark_removed(self, removed: np.ndarray, stage: str, pattern: str = ""):
+        self._removed_reason[self._positions[removed]] = self._reason_id(stage, pattern)
+
+    def _mark_pattern_removed(self, first_ids: np.ndarray, stage: str, matcher: PatternMatcher):
+        for pattern_id in np.unique(first_ids[first_ids >= 0]):
+            self._mark_removed(first_ids == pattern_id, stage, matcher.patterns[pattern_id])
+
+    def _keep_rows(self, keep: np.ndarray, **columns) -> int:
+        """Оставляет строки по маске и возвращает число удалённых"""
+        # Маска всегда даёт новый кадр, поверхностная копия лишь снимает с него отметку среза
+        self.df = self.df[keep].copy(deep=False)
+        self._positions = self._positions[keep]
+        for column, values in columns.items():
+            self.df[column] = np.asarray(values)[keep]
+        return int(len(keep) - keep.sum())
+
+    def pattern_report(self, overlap: float = 0.9, slow_factor: float = 5.0) -> pd.DataFrame:
+        """Статистика шаблонов red flags по всем строкам, прошедшим через фильтр с profile=True"""
+        if self.profiler is None:
+            self.logger.warning("Pattern profiling is disabled, create DataFilter with profile=True.")
+            return pd.DataFrame()
+        report = self.profiler.report(overlap, slow_factor)
+        dead = report["matches"] == 0
+        for stage, ids in report[dead].groupby("stage")["pattern_id"]:
+            self.logger.warning(f"{stage}: {len(ids)} patterns never matched: {', '.join(f'#{i}' for i in ids)}")
+        for row in report[~dead & (report["issues"] != "")].itertuples():
+            self.logger.warning(f"{row.stage} pattern #{row.pattern_id} '{row.pattern}': {row.issues} "
+                                f"({row.matches} matches, {row.only_removed} removed only by it, {row.seconds:.3f}s)")
+        return report
+
+    @property
+    def removed(self) -> pd.DataFrame:
+        positions = np.flatnonzero(self._removed_reason >= 0)
+        removed = self._source.iloc[positions].copy()
+        reasons = self._removed_reason[positions]
+        removed["removed_by"] = [self._removal_reasons[reason][0] for reason in reasons]
+        removed["removed_pattern"] = [self._removal_reasons[reason][1] for reason in reasons]
+        return removed
 
     def drop_duplicates(self):
-        initial_count = len(self.df)
-        self.df.drop_duplicates(subset=["url"], inplace=True)
-        self.logger.info(f"Duplicate removal: removed {initial_count - len(self.df)} records")
+        duplicated = self.df.duplicated(subset=["url"]).to_numpy()
+        if self.seen_urls is not None:
+            # В потоковом режиме дубликаты ищутся и среди предыдущих частей файла
+            duplicated = duplicated | self.seen_urls.check_and_add(self.df["url"])
+        self._mark_removed(duplicated, "drop_duplicates")
+        removed_count = self._keep_rows(~duplicated)
+        self.logger.info(f"Duplicate removal: removed {removed_count} records")
+        return self
+
+    def drop_near_duplicates(self, threshold: float = 0.8, by_domain: bool = False, num_perm: int = 64,
+                             bands: int = 16, shared_hosts=SHARED_HOSTS):
+        """
+        Схлопывает копии одной компании: строки с одним регистрируемым доменом (by_domain,
+        кроме площадок из shared_hosts) и строки с почти совпадающими заголовком и описанием
+        (MinHash + LSH, сходство Жаккара не ниже threshold). Текст сравнивается только с первой
+        строкой каждой корзины LSH, поэтому пара похожих строк, не попавших первыми ни в одну
+        общую корзину, может остаться. В каждой группе остаётся лучшая строка по
+        green_flags_count, затем по position.
+        """
+        n = len(self.df)
+        union = UnionFind(n)
+        domains = self.df["domain"] if "domain" in self.df.columns else normalize_urls(self.df["url"])["domain"]
+        domains = domains.fillna("").to_numpy()
+        grouped = np.array([by_domain and bool(domain) and domain not in shared_hosts for domain in domains],
+                           dtype=bool)
+        first_rows = {}
+        for row in np.flatnonzero(grouped):
+            union.union(first_rows.setdefault(domains[row], row), row)
+
+        texts = (self.df["title"].fillna("").astype(str) + " " + self.df["description"].fillna("").astype(str))
+        signatures = minhash_signatures(texts, num_perm=num_perm)
+        for first, second in near_duplicate_pairs(signatures, bands=bands, threshold=threshold):
+            union.union(first, second)
+
+        labels = union.labels()
+        green = self.df["green_flags_count"].fillna(0).to_numpy() if "green_flags_count" in self.df.columns else np.zeros(n)
+        position = pd.to_numeric(self.df["position"], errors="coerce").fillna(np.inf).to_numpy() \
+            if "position" in self.df.columns else np.zeros(n)
+        best = {}
+        for row in np.lexsort((np.arange(n), position, -green)):
+            best.setdefault(labels[row], row)
+        best_rows = np.array([best[label] for label in labels], dtype=np.int64)
+
+        removed = best_rows != np.arange(n)
+        same_domain = grouped & (domains == domains[best_rows])
+        self._mark_removed(removed & same_domain, "drop_near_duplicates", "same domain")
+        self._mark_removed(removed & ~same_domain, "drop_near_duplicates", "similar text")
+        removed_count = self._keep_rows(~removed)
+        self.logger.info(f"Near-duplicate removal: removed {removed_count} records")
         return self
 
     def filter_url(self):
-        original_df = self.df.copy()
-        self.df["url"] = self.df["url"].astype(str).apply(self.__clean_url)
-        self.df.dropna(subset=["url"], inplace=True)
-        self.df = self.df[self.df["url"] != ""]
+        normalized = normalize_urls(self.df["url"])
+        urls, domains = normalized["url"], normalized["domain"]
+        invalid = (urls == "").to_numpy()
+        self._mark_removed(invalid, "filter_url", "invalid url")
+        removed = invalid
 
         if self.locale:
-            self.df = self.df[self.df["url"].str.contains(self.locale, na=False)]
-
-        self.df = self.df[~self.df["url"].str.contains(self.domain_pattern, na=False)]
-        self._log_removed(original_df)
-        self.logger.info(f"URL filtering: removed {len(original_df) - len(self.df)} records")
+            off_locale = ~urls.str.contains(self.locale, na=False).to_numpy() & ~removed
+            self._mark_removed(off_locale, "filter_url", f"locale {self.locale}")
+            removed = removed | off_locale
+
+        if self.blocked_domains:
+            blocked = domains.isin(self.blocked_domains).to_numpy() & ~removed
+            self._mark_removed(blocked, "filter_url", "blocked domain")
+            removed = removed | blocked
+
+        # Регулярки запускаются только по строкам, которые ещё не отсеяны
+        first_ids = np.full(len(urls), -1, dtype=np.int64)
+        first_ids[~removed] = self._first_matches(urls[~removed], self.domain_matcher)
+        if self.profiler is not None:
+            self.profiler.record("filter_url", self.domain_matcher, urls[~removed])
+        self._mark_pattern_removed(first_ids, "filter_url", self.domain_matcher)
+        removed_count = self._keep_rows(~(removed | (first_ids >= 0)), url=urls, domain=domains)
+        self.logger.info(f"URL filtering: removed {removed_count} records")
         return self
 
+    def _filter_column(self, column: str, matcher: PatternMatcher, stage: str, as_str: bool = False) -> int:
+        values = self.df[column].fillna("")
+        values_to_check = values.astype(str) if as_str else values
+        first_ids = self._first_matches(values_to_check, matcher)
+        if self.profiler is not None:
+            self.profiler.record(stage, matcher, values_to_check)
+        self._mark_pattern_removed(first_ids, stage, matcher)
+        return self._keep_rows(first_ids < 0, **{column: values})
+
     def filter_title(self):
-        original_df = self.df.copy()
-        self.df["title"] = self.df["title"].fillna("")
-        self.df = self.df[~self.df["title"].str.contains(self.title_pattern, na=False)]
-        self._log_removed(original_df)
-        self.logger.info(f"Title filtering: removed {len(original_df) - len(self.df)} records")
+        removed_count = self._filter_column("title", self.title_matcher, "filter_title")
+        self.logger.info(f"Title filtering: removed {removed_count} records")
         return self
 
     def filter_description(self):
-        original_df = self.df.copy()
-        self.df["description"] = self.df["description"].fillna("")
-        self.df = self.df[~self.df["description"].str.contains(self.description_pattern, na=False)]
-        self._log_removed(original_df)
-        self.logger.info(f"Description filtering: removed {len(original_df) - len(self.df)} records")
+        removed_count = self._filter_column("description", self.description_matcher, "filter_description")
+        self.logger.info(f"Description filtering: removed {removed_count} records")
         return self
 
     def filter_with_custom_regex(self, column: str, pattern: str):
         if column not in self.df.columns:
             self.logger.warning(f"Column '{column}' not found.")
             return self
-        original_df = self.df.copy()
-        self.df[column] = self.df[column].fillna("")
-        compiled = re.compile(pattern, re.IGNORECASE)
-        self.df = self.df[~self.df[column].astype(str).str.contains(compiled, na=False)]
-        self._log_removed(original_df)
-        self.logger.info(f"Custom regex filtering on '{column}': removed {len(original_df) - len(self.df)} records")
+        removed_count = self._filter_column(column, PatternMatcher([pattern]), "filter_with_custom_regex", as_str=True)
+        self.logger.info(f"Custom regex filtering on '{column}': removed {removed_count} records")
         return self
 
 
-    def get_green_flags_count(self):
+    def _green_flag_hits(self, df: pd.DataFrame):
+        """Число зелёных флагов по строкам и число совпадений каждого шаблона"""
+        counts = np.zeros(len(df), dtype=np.int64)
+        pattern_counts = {}
+        for column, matcher in self.green_matchers.items():
+            if column not in df.columns:
+                continue
+            hits = matcher.all_matches(df[column].astype(str).to_numpy())
+            counts += np.fromiter(map(len, hits), dtype=np.int64, count=len(hits))
+            column_counts = [0] * len(matcher)
+            for pattern_ids in hits:
+                for pattern_id in pattern_ids:
+                    column_counts[pattern_id] += 1
+            for pattern, pattern_count in zip(matcher.patterns, column_counts):
+                pattern_counts[(column, pattern)] = pattern_count
+        return counts, pattern_counts
+
+    def get_green_flags_count(self, workers: int = None, shard_size: int = 50_000):
         if not self.green_flags:
             self.logger.warning("No green flags defined.")
             return 0
 
-        self.df["green_flags_count"] = 0
-        total_count = 0
-
-        for column, patterns in self.green_flags.items():
+        for column in self.green_flags:
             if column not in self.df.columns:
                 self.logger.warning(f"Column '{column}' not found.")
-                continue
-            compiled_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
-            for pattern in compiled_patterns:
-                matches = self.df[column].astype(str).str.contains(pattern, na=False)
-                self.df["green_flags_count"] += matches.astype(int)
-                pattern_count = matches.sum()
-                total_count += pattern_count
-                self.logger.debug(f"Patter '{pattern.pattern}' found {pattern_count} matches in column '{column}'")
-        self.df = self.df.sort_values(by="green_flags_count", ascending=False)
+
+        if workers is not None and workers > 1 and len(self.df) > shard_size:
+            shards = [self.df.iloc[start:start + shard_size] for start in range(0, len(self.df), shard_size)]
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self._worker_config(),)) as pool:
+                results = list(pool.map(_green_flags_shard, shards))
+            counts = np.concatenate([shard_counts for shard_counts, _ in results])
+            pattern_counts = {key: sum(shard_patterns[key] for _, shard_patterns in results) for key in results[0][1]}
+        else:
+            counts, pattern_counts = self._green_flag_hits(self.df)
+
+        self.df["green_flags_count"] = counts
+        total_count = 0
+        for (column, pattern), pattern_count in pattern_counts.items():
+            total_count += pattern_count
+            self.logger.debug(f"Patter '{pattern}' found {pattern_count} matches in column '{column}'")
+        order = self.df["green_flags_count"].reset_index(drop=True).sort_values(ascending=False).index.to_numpy()
+        self.df = self.df.iloc[order]
+        self._positions = self._positions[order]
         self.logger.info(f"Total green flags found: {total_count}")
 
     def apply_all(self):
@@ -180,118 +338,223 @@ class DataFilter:
                 .df
         )
 
+    def apply_all_parallel(self, workers: int = None, shard_size: int = 50_000):
+        """
+        То же, что apply_all, но построчные фильтры выполняются пулом процессов.
+        Дубликаты удаляются заранее по всему кадру, затем кадр режется на части
+        по shard_size строк, результаты склеиваются в исходном порядке.
+        """
+        self.logger.info(f"Starting parallel filtering with {len(self.df)} records")
+        self.drop_duplicates()
+        if len(self.df) <= shard_size or workers == 1:
+            return self.filter_url().filter_title().filter_description().df
+
+        starts = range(0, len(self.df), shard_size)
+        shards = (self.df.iloc[start:start + shard_size] for start in starts)
+        kept_frames, kept_positions = [], []
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self._worker_config(),)) as pool:
+            for start, (kept, local_kept, local_reason, reasons, profiler) in zip(starts, pool.map(_filter_shard, shards)):
+                if profiler is not None:
+                    self.profiler.merge(profiler)
+                positions = self._positions[start:start + shard_size]
+                for reason_id, (stage, pattern) in enumerate(reasons):
+                    self._removed_reason[positions[local_reason == reason_id]] = self._reason_id(stage, pattern)
+                kept_frames.append(kept)
+                kept_positions.append(positions[local_kept])
+
+        self.df = pd.concat([frame for frame in kept_frames if len(frame)] or kept_frames[:1])
+        self._positions = np.concatenate(kept_positions)
+        self.logger.info(f"Parallel filtering: {len(self.df)} records left after {len(kept_frames)} shards")
+        return self.df
+
+    def apply_all_in_chunks(self, csv_path: str, output_path: str, removed_path: str = None, chunksize: int = 100_000,
+                            columns: list = None):
+        """
+        Потоковый режим для файлов больше памяти: файл читается частями,
+        к каждой части применяется apply_all, результат дописывается в output_path
+        (и удалённые строки в removed_path). Дубликаты адресов ищутся по всему файлу.
+        Формат файлов (CSV, Parquet, Feather) определяется по расширению.
+        """
+        self.seen_urls = SeenUrls()
+        removed_count = 0
+        removed_writer = TableWriter(removed_path) if removed_path is not None else None
+        with TableWriter(output_path) as writer:
+            for chunk in iter_table(csv_path, chunksize, columns=columns):
+                self._set_frame(chunk)
+                self.apply_all()
+                writer.write(self.df)
+                removed = self.removed
+                if removed_writer is not None and not removed.empty:
+                    removed_writer.write(removed)
+                removed_count += len(removed)
+        if removed_writer is not None:
+            removed_writer.close()
+        self.logger.info(f"Chunked filtering finished: kept {writer.rows}, removed {removed_count} records")
+        self.seen_urls = None
+        return self
+
+    def save(self, path: str):
+        """Сохранение в формате по расширению: .parquet, .feather или CSV"""
+        write_table(self.df, path)
+        self.logger.info(f"Saved filtered data to {path} ({len(self.df)} records)")
+
+    def save_removed(self, path: str):
+        removed = self.removed
+        if not removed.empty:
+            write_table(removed, path)
+            self.logger.info(f"Saved removed records to {path} ({len(removed)} records)")
+
     def save_to_csv(self, path: str):
         self.df.to_csv(path, sep="|", index=False, encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
         self.logger.info(f"Saved filtered data to {path} ({len(self.df)} records)")
 
     def save_removed_to_csv(self, path: str):
-        if not self.removed.empty:
-            self.removed.to_csv(path, sep="|", index=False, encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
-            self.logger.info(f"Saved removed records to {path} ({len(self.removed)} records)")
+        removed = self.removed
+        if not removed.empty:
+            removed.to_csv(path, sep="|", index=False, encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
+            self.logger.info(f"Saved removed records to {path} ({len(removed)} records)")
+
+_worker_filter = None
+
+
+def _init_worker(config: dict):
+    """Собирает фильтр один раз на процесс, чтобы шаблоны компилировались однократно"""
+    global _worker_filter
+    _worker_filter = DataFilter(locale=config["locale"], green_flags=config["green_flags"], profile=config["profile"])
+    _worker_filter.bad_domains = config["bad_domains"]
+    _worker_filter.blocked_domains = config["blocked_domains"]
+    _worker_filter.bad_title = config["bad_title"]
+    _worker_filter.bad_description = config["bad_description"]
+    _worker_filter._compile_regex_patterns()
+    _worker_filter.logger.setLevel(logging.WARNING)
+
+
+def _filter_shard(shard: pd.DataFrame):
+    _worker_filter._set_frame(shard)
+    if _worker_filter.profiler is not None:
+        # Статистика каждой части отдаётся целиком и суммируется в основном процессе
+        _worker_filter.profiler = RuleProfiler()
+    _worker_filter.filter_url().filter_title().filter_description()
+    return (_worker_filter.df, _worker_filter._positions,
+            _worker_filter._removed_reason, _worker_filter._removal_reasons, _worker_filter.profiler)
+
+
+def _green_flags_shard(shard: pd.DataFrame):
+    return _worker_filter._green_flag_hits(shard)
+
+
+# Правила запуска main(), вынесены на уровень модуля для бенчмарков и профилирования
+RED_FLAGS = {
+    "url": [
+        r"\.(?:ru|ua)\b",  # объединил .ru и .ua
+        r"\/\/top\.",
+        r"\/\/gigal\.",
+        r"\/\/market.sello\.",
+        r"\/\/yopt\.",
+        r"report\.kg",
+        r"uzbekistan\.mfa\.gov",
+        r"wikimapia",
+        r"uzfoodexpo",
+        r"sprav\.uz",
+        r"(?:com|jp)/ru\b",
+        r"bizkim\.uz",
+        r"\/\/mover\.uz",
+        r"\/\/xitoydan\.uz",
+        r"\/\/lenta\.com",
+        r"\/\/evu\.uz",
+        r"uz\.bizorg\.su",
+        r"\/\/tovar",
+        r"news",
+        r"\/\/orzon",
+        r"\/\/uzdaily",
+        r"\/\/tutto",
+        r"\/\/agrobaza",
+        r"\/\/uzum",
+        r"\/\/biotus",
+        r"\/\/glotr",
+        r"\/\/lochin",
+    ],
+    "title": [
+        r"(?i)\bсеть кондитерских\w*",
+        r"(?i)\bдетск\w*",
+        r"(?i)госкомстат",
+        r"(?i)омское",
+        r"(?i)линия по производству",
+        r"(?i)\b(?:охот|рыбал)\w*",
+        r"(?i)\bигр\w*",
+        r"(?i)\bваканси\w*",
+        r"(?i)\b(?:спецодежд|спецобув)\w*",
+        r"(?i)\bхим\w*",
+        r"(?i)\b(?:секонд[ -]?хенд|second[ -]?hand)\b",
+        r"(?i)\bмебел\w*",
+        r"(?i)\bвыставк\w*",
+        r"(?i)\bматериал\w*",
+        r"(?i)Поиск по запросу",
+        r"(?i)\bпрокат\w*",
+        r"(?i)\bстроител\w*",
+        r"(?i)оборудование для произво",
+        r"(?i)\bновост[ейя]\w*",
+        r"(?i)\bновостро[йек]\w*",
+        r"(?i)\bсеть супермаркетов"
+
+    ],
+    "description": [
+        r"(?i)\bсеть кондитерских",
+        r"(?i)\bоплат\w*",
+        r"(?i)\b(?:из|в)\s+росси[яию]\b",
+        r"(?i)\bваканси\w*",
+        r"(?i)линия по производству",
+        r"(?i)\b(?:канцелярия|канцтовар\w*)",
+        r"(?i)\bортопедическ(?:ая|их|ое)",
+        r"(?i)\bдиллер\w*\b",
+        r"(?i)\bсписок\s+(?:поставщик\w*|компани\w*|фирм\w*|магазин\w*|сайт\w*|ресурс\w*)",
+        r"(?i)\bсписок организаций",
+        r"(?i)\bаптек[ае]\w*",
+        r"(?i)\bукраин[аы]\w*",
+        r"(?i)\bказахстан\w*",
+        r"(?i)\bоборудование для произво",
+        r"(?i)\bпроизводители\s*(?:и|,)?\s*поставщики\s+оборудовани[яеё]\w*",
+        r"(?i)\bсправочная\s+информация\b",
+        r"(?i)\bсеть супермаркетов",
+        r"(?i)рф",
+        r"^\d{1,2}\s[а-яё]{3,8}\b",  # даты типа "10 июня"
+        r"(?i)\bпроизводители\s*(?:и|,|\s+)?поставщики\s+оборудовани[яеё]\w*"
+    ]
+}
+
+GREEN_FLAGS = {
+    # "url": [
+    #     r"\b(?:optovik|optoviki|opto)\b",
+    #     r"\b(?:wholesale|wholesaler|wholesalers)\b",
+    #     r"\b(?:distributor|distributors)\b",
+    #     r"\b(?:supplier|suppliers)\b"
+    # ],
+    # "title": [
+    #     r"\b(?:оптовый\s+продавец|оптовая\s+компания|оптовая\s+фирма)\b",
+    #     r"\b(?:дистрибьютор|дистрибьюторы)\b",
+    #     r"\b(?:оптовые\s+поставки|оптовые\s+поставщики)\b"
+    #     r"\bмагазин\w*",
+    # ],
+    # "description": [
+    #     r"\b(?:оптовые\s+цены|оптовые\s+условия)\b",
+    #     r"\b(?:оптовая\s+продажа|оптовая\s+продажи)\b"
+    # ]
+}
+
 
 def main():
-    df = pd.read_csv("data_frame_csv/filtered_output.csv", sep="|")
+    # Вход - выгрузка parse_google_search, результат пишется в отдельный файл, а не поверх входа
+    df = read_table("data_frame_csv/crude_base_uz.parquet")
     print(f"Initial data loaded with {df.shape[0]} records.")
 
-    red_flags = {
-        "url": [
-            r"\.(?:ru|ua)\b",  # объединил .ru и .ua
-            r"\/\/top\.",
-            r"\/\/gigal\.",
-            r"\/\/market.sello\.",
-            r"\/\/yopt\.",
-            r"report\.kg",
-            r"uzbekistan\.mfa\.gov",
-            r"wikimapia",
-            r"uzfoodexpo",
-            r"sprav\.uz",
-            r"(?:com|jp)/ru\b",
-            r"bizkim\.uz",
-            r"\/\/mover\.uz",
-            r"\/\/xitoydan\.uz",
-            r"\/\/lenta\.com",
-            r"\/\/evu\.uz",
-            r"uz\.bizorg\.su",
-            r"\/\/tovar",
-            r"news",
-            r"\/\/orzon",
-            r"\/\/uzdaily",
-            r"\/\/tutto",
-            r"\/\/agrobaza",
-            r"\/\/uzum",
-            r"\/\/biotus",
-            r"\/\/glotr",
-            r"\/\/lochin",
-        ],
-        "title": [
-            r"(?i)\bсеть кондитерских\w*",
-            r"(?i)\bдетск\w*",
-            r"(?i)госкомстат",
-            r"(?i)омское",
-            r"(?i)линия по производству",
-            r"(?i)\b(?:охот|рыбал)\w*",
-            r"(?i)\bигр\w*",
-            r"(?i)\bваканси\w*",
-            r"(?i)\b(?:спецодежд|спецобув)\w*",
-            r"(?i)\bхим\w*",
-            r"(?i)\b(?:секонд[ -]?хенд|second[ -]?hand)\b",
-            r"(?i)\bмебел\w*",
-            r"(?i)\bвыставк\w*",
-            r"(?i)\bматериал\w*",
-            r"(?i)Поиск по запросу",
-            r"(?i)\bпрокат\w*",
-            r"(?i)\bстроител\w*",
-            r"(?i)оборудование для произво",
-            r"(?i)\bновост[ейя]\w*",
-            r"(?i)\bновостро[йек]\w*",
-            r"(?i)\bсеть супермаркетов"
-
-        ],
-        "description": [
-            r"(?i)\bсеть кондитерских",
-            r"(?i)\bоплат\w*",
-            r"(?i)\b(?:из|в)\s+росси[яию]\b",
-            r"(?i)\bваканси\w*",
-            r"(?i)линия по производству",
-            r"(?i)\b(?:канцелярия|канцтовар\w*)",
-            r"(?i)\bортопедическ(?:ая|их|ое)",
-            r"(?i)\bдиллер\w*\b",
-            r"(?i)\bсписок\s+(?:поставщик\w*|компани\w*|фирм\w*|магазин\w*|сайт\w*|ресурс\w*)",
-            r"(?i)\bсписок организаций",
-            r"(?i)\bаптек[ае]\w*",
-            r"(?i)\bукраин[аы]\w*",
-            r"(?i)\bказахстан\w*",
-            r"(?i)\bоборудование для произво",
-            r"(?i)\bпроизводители\s*(?:и|,)?\s*поставщики\s+оборудовани[яеё]\w*",
-            r"(?i)\bсправочная\s+информация\b",
-            r"(?i)\bсеть супермаркетов",
-            r"(?i)рф",
-            r"^\d{1,2}\s[а-яё]{3,8}\b",  # даты типа "10 июня"
-            r"(?i)\bпроизводители\s*(?:и|,|\s+)?поставщики\s+оборудовани[яеё]\w*"
-        ]
-    }
-
-    green_flags = {
-        # "url": [
-        #     r"\b(?:optovik|optoviki|opto)\b",
-        #     r"\b(?:wholesale|wholesaler|wholesalers)\b",
-        #     r"\b(?:distributor|distributors)\b",
-        #     r"\b(?:supplier|suppliers)\b"
-        # ],
-        # "title": [
-        #     r"\b(?:оптовый\s+продавец|оптовая\s+компания|оптовая\s+фирма)\b",
-        #     r"\b(?:дистрибьютор|дистрибьюторы)\b",
-        #     r"\b(?:оптовые\s+поставки|оптовые\s+поставщики)\b"
-        #     r"\bмагазин\w*",
-        # ],
-        # "description": [
-        #     r"\b(?:оптовые\s+цены|оптовые\s+условия)\b",
-        #     r"\b(?:оптовая\s+продажа|оптовая\s+продажи)\b"
-        # ]
-    }
-    data_filter = DataFilter(df, red_flags=red_flags)
+    # Статистика по шаблонам: какие не срабатывают, дублируют друг друга или слишком медленные
+    profile = False
+    data_filter = DataFilter(df, red_flags=RED_FLAGS, profile=profile)
     filtered_df = data_filter.apply_all()
-    data_filter_2 = DataFilter(filtered_df, green_flags=green_flags)
+    if profile:
+        data_filter.pattern_report().to_csv("data_frame_csv/pattern_report.csv", sep="|", index=False)
+    data_filter_2 = DataFilter(filtered_df, green_flags=GREEN_FLAGS)
+    data_filter_2.drop_near_duplicates()
     data_filter_2.save_to_csv("data_frame_csv/filtered_output.csv")
 
 if __name__ == "__main__":
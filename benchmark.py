@@ -0,0 +1,356 @@
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STAGES = ("filter_url", "filter_title", "filter_description", "green_flags", "parse_result", "classification")
+
+SITE_PROFILE = "Оптовый продавец или дистрибьютор обуви"
+
+# Зелёные флаги в main() DataFilter закомментированы, для замера берём их же
+GREEN_FLAGS = {
+    "url": [
+        r"\b(?:optovik|optoviki|opto)\b",
+        r"\b(?:wholesale|wholesaler|wholesalers)\b",
+        r"\b(?:distributor|distributors)\b",
+        r"\b(?:supplier|suppliers)\b",
+    ],
+    "title": [
+        r"\b(?:оптовый\s+продавец|оптовая\s+компания|оптовая\s+фирма)\b",
+        r"\b(?:дистрибьютор|дистрибьюторы)\b",
+        r"\b(?:оптовые\s+поставки|оптовые\s+поставщики)\b",
+        r"\bмагазин\w*",
+    ],
+    "description": [
+        r"\b(?:оптовые\s+цены|оптовые\s+условия)\b",
+        r"\b(?:оптовая\s+продажа|оптовая\s+продажи)\b",
+    ],
+}
+
+# Словари генератора: обычные строки выдачи и примеси, на которые срабатывают red_flags
+_PRODUCTS = ["обуви", "кроссовок", "ботинок", "туфель", "сапог", "сандалий", "тапочек", "кед"]
+_KINDS = ["Оптовые поставщики", "Дистрибьютор", "Оптовый магазин", "Производитель", "Оптовая продажа",
+          "Купить оптом", "Оптовая компания", "Склад"]
+_BAD_TITLE_WORDS = ["детской", "спецобуви", "вакансии", "новости", "каталог", "игровой"]
+_DESCRIPTIONS = [
+    "Мы предлагаем оптовую доставку по всему Узбекистану.",
+    "Широкий ассортимент, оптовые цены и гибкие условия для магазинов.",
+    "Компания занимается производством и оптовыми поставками более 15 лет.",
+    "Работаем с маркетплейсами и розничными сетями, отгрузка со склада в день заказа.",
+    "Прямые поставки от фабрик Турции и Китая, сертификаты на всю продукцию.",
+]
+_BAD_DESCRIPTIONS = [
+    "Вакансии компании и условия работы.",
+    "Доставка из России за 3 дня, оплата при получении.",
+    "10 июня открылась выставка лёгкой промышленности.",
+    "Список поставщиков и компаний вашего города.",
+]
+_SYLLABLES = ["opt", "shoe", "tex", "step", "uz", "trade", "bas", "fab", "mart", "lux", "eco", "nova"]
+_TLDS = [".uz", ".uz", ".uz", ".com", ".kz", ".kg", ".ru", ".co.uz"]
+_BAD_SITES = ["https://www.ozon.ru/category/obuv", "https://www.wildberries.ru/catalog/obuv",
+              "https://2gis.uz/tashkent/search/obuv", "https://www.youtube.com/watch?v=abc",
+              "https://uz.bizorg.su/obuv-r/tashkent", "https://kun.uz/news/2023/06/10/obuv"]
+_PATHS = ["", "/", "/catalog", "/opt", "/contacts", "/about", "/products/obuv"]
+_QUERIES = ["оптовые поставщики обуви", "дистрибьюторы обуви", "обувь оптом", "оптовые поставщики кроссовок"]
+_CITIES = ["Ташкент", "Самарканд", "Бухара", "Наманган", "Андижан", "Фергана"]
+
+
+def synthetic_frame(rows: int, seed: int = 0, bad_share: float = 0.2, duplicate_share: float = 0.05) -> pd.DataFrame:
+    """
+    Синтетическая выдача в схеме filtered_output.csv. Около bad_share строк содержат
+    слова и адреса, отсеиваемые фильтрами, duplicate_share строк повторяют адрес более ранней строки.
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return pd.Series(np.asarray(values, dtype=object)[rng.integers(0, len(values), rows)])
+
+    def mask(share):
+        return rng.random(rows) < share
+
+    product, city = pick(_PRODUCTS), pick(_CITIES)
+    company = pick(_SYLLABLES) + pick(_SYLLABLES) + pd.Series(rng.integers(1, 10_000, rows)).astype(str)
+
+    title = pick(_KINDS) + " " + product + " в " + city + " | " + company.str.upper()
+    bad_title = mask(bad_share / 2)
+    title[bad_title] = "Каталог " + pick(_BAD_TITLE_WORDS)[bad_title] + " " + product[bad_title]
+
+    description = pick(_DESCRIPTIONS) + " " + pick(_DESCRIPTIONS)
+    bad_description = mask(bad_share / 2)
+    description[bad_description] = pick(_BAD_DESCRIPTIONS)[bad_description] + " " + description[bad_description]
+
+    url = "https://" + pd.Series(np.where(mask(0.5), "www.", ""), dtype=object) + company + pick(_TLDS) + pick(_PATHS)
+    bad_url = mask(bad_share / 2)
+    url[bad_url] = pick(_BAD_SITES)[bad_url]
+    duplicated = np.flatnonzero(mask(duplicate_share))
+    duplicated = duplicated[duplicated > 0]
+    url[duplicated] = url.to_numpy()[rng.integers(0, duplicated)]
+
+    return pd.DataFrame({
+        "position": rng.integers(1, 300, rows),
+        "title": title,
+        "description": description,
+        "url": url,
+        "keywords": product + " оптом",
+        "query": pick(_QUERIES),
+        "city": city,
+        "green_flags_count": rng.integers(0, 4, rows),
+    })
+
+
+def fake_apify_payload(df: pd.DataFrame) -> list:
+    """
+    Строки набора данных Apify в формате jsonl после unwind=organicResults:
+    поля результата на верхнем уровне плюс searchQuery исходного запроса.
+    """
+    lines = []
+    for position, title, description, url, keywords, query, city in zip(
+            df["position"], df["title"], df["description"], df["url"], df["keywords"], df["query"], df["city"]):
+        lines.append(json.dumps({
+            "searchQuery": {"term": f"{query} {city}", "page": 1, "type": "SEARCH", "countryCode": "uz",
+                            "languageCode": "ru"},
+            "position": int(position),
+            "title": title,
+            "url": url,
+            "displayedUrl": url,
+            "description": description,
+            "emphasizedKeywords": keywords.split(),
+            "siteLinks": [],
+        }, ensure_ascii=False).encode("utf-8"))
+    return lines
+
+
+class FakeResponse:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """Подставляется в parse_result вместо requests: отдаёт заранее собранные строки без сети"""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def get(self, url, **kwargs):
+        return FakeResponse(self.lines)
+
+
+def tiny_model(path: str, texts, vocab_size: int = 2000, seed: int = 0) -> str:
+    """
+    Маленькая локальная GPT-2 со случайными весами и BPE-токенизатором, обученным на texts.
+    Ответы бессмысленны, но форма вычислений та же, что у rugpt3small, и скачивать ничего не нужно.
+    """
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<|endoftext|>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(list(texts) + ["Ответь только 'да' или 'нет': да нет Да Нет"], trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>",
+                                        bos_token="<|endoftext|>")
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=512, n_embd=64, n_layer=2, n_head=2,
+                        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    GPT2LMHeadModel(config).save_pretrained(path)
+    return path
+
+
+def memory_mb(field: str) -> float:
+    """
+    VmRSS (текущая) или VmHWM (пиковая) память процесса. ru_maxrss не подходит: в Linux
+    он переживает exec и в новом процессе показывает пик родителя, загрузившего модель.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Вне Linux остаётся ru_maxrss (в macOS в байтах, но и /proc там нет)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_memory():
+    """Сбрасывает VmHWM до текущей памяти, чтобы пик считался только по замеряемому вызову"""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _prepare_stage(stage: str, rows: int, seed: int, model_dir: str):
+    """Данные и вызов для замера; подготовка в замер не входит"""
+    from DataFilter import DataFilter, RED_FLAGS
+
+    df = synthetic_frame(rows, seed)
+    if stage in ("filter_url", "filter_title", "filter_description"):
+        # Каждый фильтр замеряется на всём кадре, без отсева предыдущими стадиями
+        data_filter = DataFilter(df, red_flags=RED_FLAGS)
+        data_filter.logger.setLevel(logging.WARNING)
+        return getattr(data_filter, stage)
+    if stage == "green_flags":
+        data_filter = DataFilter(df, green_flags=GREEN_FLAGS)
+        data_filter.logger.setLevel(logging.WARNING)
+        return data_filter.get_green_flags_count
+    if stage == "parse_result":
+        from parse_google_search import parse_result
+
+        session = FakeSession(fake_apify_payload(df))
+        return lambda: parse_result("https://api.apify.com/v2/datasets/benchmark/items", session=session)
+    if stage == "classification":
+        from classifier import PrefixCache, batch_score, load_model
+
+        tokenizer, model, device = load_model(model_dir)
+        prefix_cache = PrefixCache(tokenizer, model, device)
+        return lambda: batch_score(df, tokenizer, model, device, SITE_PROFILE, prefix_cache=prefix_cache)
+    raise ValueError(f"Неизвестная стадия: {stage}")
+
+
+def _run_stage(stage: str, rows: int, seed: int, model_dir: str, queue):
+    """Выполняется в отдельном процессе, чтобы пиковая память считалась для каждой стадии отдельно"""
+    try:
+        run = _prepare_stage(stage, rows, seed, model_dir)
+        rss_before = memory_mb("VmRSS")
+        reset_peak_memory()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    except Exception as e:
+        queue.put({"error": repr(e)})
+        return
+    queue.put({"seconds": elapsed, "rss_before_mb": rss_before, "peak_rss_mb": memory_mb("VmHWM")})
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "pandas": pd.__version__, "numpy": np.__version__}
+
+
+def run_benchmark(sizes=(10_000, 100_000), stages=STAGES, seed: int = 0, max_parse_rows: int = 1_000_000,
+                  max_classify_rows: int = 2_000, model_dir: str = None, stage_timeout: float = 3600) -> dict:
+    """
+    Замеряет стадии на синтетических данных каждого размера из sizes (от 10 тысяч до 10 миллионов строк).
+    Каждая стадия запускается в новом процессе; parse_result и классификация ограничены
+    max_parse_rows и max_classify_rows строк, фактическое число строк пишется в результат.
+    Упавшая или не уложившаяся в stage_timeout секунд стадия записывается со status="failed".
+    """
+    # classifier тянет torch, поэтому импортируется здесь, в родителе, а не в процессах стадий
+    from classifier import wait_for_result
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    # Временная модель для классификации удаляется вместе с каталогом после замера
+    with tempfile.TemporaryDirectory(prefix="benchmark_model_") as temp_dir:
+        if "classification" in stages and model_dir is None:
+            model_dir = tiny_model(temp_dir, synthetic_frame(2_000, seed)[["title", "description"]].stack())
+        for size in sizes:
+            for stage in stages:
+                rows = min(size, {"parse_result": max_parse_rows, "classification": max_classify_rows}.get(stage, size))
+                queue = context.Queue()
+                process = context.Process(target=_run_stage, args=(stage, rows, seed, model_dir, queue))
+                process.start()
+                stats = wait_for_result(process, queue, stage_timeout)
+                process.join()
+                if stats is None or "error" in stats:
+                    error = stats["error"] if stats else "процесс завершился без результата или по таймауту"
+                    results.append({"stage": stage, "size": size, "rows": rows, "status": "failed",
+                                    "exitcode": process.exitcode, "error": error})
+                    logger.error(f"{stage} ({rows} строк): не выполнена, код завершения {process.exitcode}: {error}")
+                    continue
+                stats.update(stage=stage, size=size, rows=rows, status="ok", rows_per_s=rows / stats["seconds"])
+                results.append(stats)
+                logger.info(f"{stage} ({rows} строк): {stats['seconds']:.2f} с, {stats['rows_per_s']:.0f} строк/с, "
+                            f"пик памяти {stats['peak_rss_mb']:.0f} МБ (+{stats['peak_rss_mb'] - stats['rss_before_mb']:.0f})")
+    return {"created_at": time.time(), "seed": seed, "environment": _environment(), "results": results}
+
+
+def save_results(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare_results(baseline: dict, report: dict, tolerance: float = 0.2) -> list:
+    """
+    Регрессии относительно базового замера: скорость стадии упала или пиковая память выросла
+    больше чем на tolerance, или стадия перестала выполняться.
+    Сравниваются только стадии с тем же размером и числом строк.
+    """
+    reference = {(item["stage"], item["size"], item["rows"]): item for item in baseline["results"]
+                 if item.get("status", "ok") == "ok"}
+    regressions = []
+    for item in report["results"]:
+        previous = reference.get((item["stage"], item["size"], item["rows"]))
+        if previous is None:
+            continue
+        if item.get("status", "ok") == "failed":
+            regressions.append(f"{item['stage']} ({item['rows']} строк): не выполнена ({item['error']})")
+            continue
+        speed = item["rows_per_s"] / previous["rows_per_s"]
+        memory = item["peak_rss_mb"] / previous["peak_rss_mb"]
+        if speed < 1 - tolerance:
+            regressions.append(f"{item['stage']} ({item['rows']} строк): скорость {speed:.0%} от базовой")
+        if memory > 1 + tolerance:
+            regressions.append(f"{item['stage']} ({item['rows']} строк): пиковая память {memory:.0%} от базовой")
+    return regressions
+
+
+def main():
+    baseline_path = "benchmark_baseline.json"
+    output_path = "benchmark_results.json"
+
+    report = run_benchmark(sizes=(10_000, 100_000))
+    save_results(report, output_path)
+    if not os.path.exists(baseline_path):
+        save_results(report, baseline_path)
+        logger.info(f"Базовый замер сохранён в '{baseline_path}'")
+        return
+    regressions = compare_results(load_results(baseline_path), report)
+    for regression in regressions:
+        logger.warning(f"Регрессия: {regression}")
+    if not regressions:
+        logger.info("Регрессий относительно базового замера нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,518 @@
-import csv
+import hashlib
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+from queue import Empty
 
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
-import pandas as pd
 import logging
 from tqdm import tqdm
 
+from pre_classifier import PreClassifier, tiered_score
+from table_io import read_table, write_table
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_model(model_name):
-    """Загрузка модели и токенизатора с обработкой ошибок"""
+def set_cpu_threads(num_threads=None, interop_threads=None):
+    """Число потоков внутри операций и между ними; interop задаётся только до первых вычислений"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Не удалось задать число inter-op потоков: {e}")
+
+def conv1d_to_linear(model):
+    """
+    GPT-2 хранит проекции в transformers Conv1D, а динамическая квантизация
+    понимает только nn.Linear, поэтому слои заменяются эквивалентными Linear.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+                linear.bias = torch.nn.Parameter(child.bias.detach())
+                setattr(parent, name, linear)
+    return model
+
+def load_model(model_name, backend="fp32", num_threads=None, interop_threads=None, compile_model=False):
+    """
+    Загрузка модели и токенизатора с обработкой ошибок.
+    backend="int8" - динамическая int8-квантизация линейных слоёв для CPU,
+    compile_model=True дополнительно компилирует основную часть модели через torch.compile.
+    """
     try:
-        logger.info(f"Загрузка модели {model_name}...")
+        logger.info(f"Загрузка модели {model_name} ({backend})...")
+        set_cpu_threads(num_threads, interop_threads)
         tokenizer = AutoTokenizer.from_pretrained(model_name)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = "cuda" if torch.cuda.is_available() and backend == "fp32" else "cpu"
         logger.info(f"Используется устройство: {device}")
         model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
+        model.eval()
+        if backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend != "fp32":
+            raise ValueError(f"Неизвестный backend: {backend}")
+        if compile_model:
+            setattr(model, model.base_model_prefix, torch.compile(model.base_model, dynamic=True))
         return tokenizer, model, device
     except Exception as e:
         logger.error(f"Ошибка при загрузке модели: {e}")
         raise
 
-def zero_shot_classify(title, description, site_profile, tokenizer, model, device):
-    try:
-        prompt = (
-            f"Определи, является ли сайт компанией, которая занимается {site_profile}.\n"
-            f"Заголовок: {title}\n"
-            f"Описание: {description}\n"
-            "Ответь только 'да' или 'нет':"
-        )
+def build_prefix(site_profile):
+    return f"Определи, является ли сайт компанией, которая занимается {site_profile}.\n"
+
+def build_suffix(title, description):
+    return (
+        f"Заголовок: {title}\n"
+        f"Описание: {description}\n"
+        "Ответь только 'да' или 'нет':"
+    )
 
-        inputs = tokenizer.encode(prompt, return_tensors="pt").to(device)
-        with torch.no_grad():  # Отключаем вычисление градиентов для экономии памяти
+def build_prompt(title, description, site_profile):
+    return build_prefix(site_profile) + build_suffix(title, description)
+
+def parse_answer(result):
+    """Более надежная проверка ответа"""
+    result = result.strip().lower()
+    if "да" in result and "нет" not in result:
+        return "да"
+    elif "нет" in result:
+        return "нет"
+    else:
+        logger.warning(f"Неоднозначный ответ: '{result}'. Возвращаем 'нет'")
+        return "нет"
+
+def classify_batch(prompts, tokenizer, model, device):
+    """Генерация ответов для всего батча одним вызовом generate с паддингом слева"""
+    try:
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(device)
+        with torch.inference_mode():  # Отключаем вычисление градиентов для экономии памяти
             outputs = model.generate(
-                inputs,
-                max_length=inputs.shape[1] + 5,
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=5,
                 do_sample=False,
                 pad_token_id=tokenizer.eos_token_id
             )
-        answer = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # Получаем только сгенерированное после prompt
+        answers = tokenizer.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        return [parse_answer(answer) for answer in answers]
+    except Exception as e:
+        logger.error(f"Ошибка при классификации: {e}")
+        return ["ошибка"] * len(prompts)
 
-        # Получаем ответ после prompt и анализируем его более тщательно
-        result = answer[len(prompt):].strip().lower()
+def zero_shot_classify(title, description, site_profile, tokenizer, model, device):
+    return classify_batch([build_prompt(title, description, site_profile)], tokenizer, model, device)[0]
 
-        # Более надежная проверка ответа
-        if "да" in result and "нет" not in result:
-            return "да"
-        elif "нет" in result:
-            return "нет"
-        else:
-            logger.warning(f"Неоднозначный ответ: '{result}'. Возвращаем 'нет'")
-            return "нет"
+def answer_token_ids(tokenizer, answer):
+    """Первые токены всех вариантов написания ответа ('да', ' да', 'Да', ' Да')"""
+    variants = {answer, " " + answer, answer.capitalize(), " " + answer.capitalize()}
+    return sorted({tokenizer.encode(variant)[0] for variant in variants})
+
+def score_batch(prompts, tokenizer, model, device):
+    """
+    Один прямой проход по батчу без генерации. Возвращает для каждого промпта разность
+    логарифмов вероятностей следующего токена 'да' и 'нет' (NaN при ошибке).
+    """
+    try:
+        tokenizer.padding_side = "right"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(device)
+        with torch.inference_mode():
+            hidden = model.base_model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).last_hidden_state
+            # Логиты нужны только в позиции последнего реального токена каждой строки
+            last = inputs["attention_mask"].sum(dim=1) - 1
+            logits = model.get_output_embeddings()(hidden[torch.arange(len(prompts)), last])
+            log_probs = torch.log_softmax(logits.float(), dim=-1)
+        yes = torch.logsumexp(log_probs[:, answer_token_ids(tokenizer, "да")], dim=-1)
+        no = torch.logsumexp(log_probs[:, answer_token_ids(tokenizer, "нет")], dim=-1)
+        return (yes - no).tolist()
     except Exception as e:
         logger.error(f"Ошибка при классификации: {e}")
-        return "ошибка"
+        return [float("nan")] * len(prompts)
+
+class PrefixCache:
+    """
+    Ключи и значения внимания для общего начала промпта, посчитанные один раз
+    на каждый site_profile. Строки батча прогоняются только по своему суффиксу.
+    """
+
+    def __init__(self, tokenizer, model, device):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.entries = {}
+
+    def get(self, site_profile):
+        if site_profile not in self.entries:
+            prefix_ids = self.tokenizer(build_prefix(site_profile), return_tensors="pt")["input_ids"].to(self.device)
+            with torch.inference_mode():
+                past = self.model(prefix_ids, use_cache=True).past_key_values
+            self.entries[site_profile] = (prefix_ids.shape[1], self._tensors(past))
+        return self.entries[site_profile]
+
+    @staticmethod
+    def _tensors(past):
+        if isinstance(past, tuple):
+            return [tuple(layer[:2]) for layer in past]
+        if hasattr(past, "layers"):
+            return [(layer.keys, layer.values) for layer in past.layers]
+        return list(zip(past.key_cache, past.value_cache))
+
+    @staticmethod
+    def expand(tensors, batch_size):
+        """Новый кэш на каждый батч: модель дописывает в него ключи суффикса"""
+        expanded = tuple((k.expand(batch_size, -1, -1, -1), v.expand(batch_size, -1, -1, -1)) for k, v in tensors)
+        try:
+            from transformers import DynamicCache
+        except ImportError:
+            return expanded
+        if hasattr(DynamicCache, "from_legacy_cache"):
+            return DynamicCache.from_legacy_cache(expanded)
+        return DynamicCache(expanded)
+
+def score_suffix_batch(suffixes, prefix_cache, site_profile, tokenizer, model, device):
+    """То же, что score_batch, но общее начало промпта берётся из PrefixCache"""
+    try:
+        prefix_length, tensors = prefix_cache.get(site_profile)
+        tokenizer.padding_side = "right"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        inputs = tokenizer(suffixes, return_tensors="pt", padding=True).to(device)
+        batch_size, length = inputs["input_ids"].shape
+        attention_mask = torch.cat(
+            [torch.ones(batch_size, prefix_length, dtype=inputs["attention_mask"].dtype, device=device),
+             inputs["attention_mask"]], dim=1)
+        position_ids = torch.arange(prefix_length, prefix_length + length, device=device).expand(batch_size, -1)
+        with torch.inference_mode():
+            hidden = model.base_model(
+                input_ids=inputs["input_ids"],
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=PrefixCache.expand(tensors, batch_size),
+                use_cache=True,
+            ).last_hidden_state
+            last = inputs["attention_mask"].sum(dim=1) - 1
+            logits = model.get_output_embeddings()(hidden[torch.arange(batch_size), last])
+            log_probs = torch.log_softmax(logits.float(), dim=-1)
+        yes = torch.logsumexp(log_probs[:, answer_token_ids(tokenizer, "да")], dim=-1)
+        no = torch.logsumexp(log_probs[:, answer_token_ids(tokenizer, "нет")], dim=-1)
+        return (yes - no).tolist()
+    except Exception as e:
+        logger.error(f"Ошибка при классификации: {e}")
+        return [float("nan")] * len(suffixes)
+
+def margins_to_probabilities(margins, calibration=(1.0, 0.0)):
+    """Вероятность ответа 'да' с калибровкой Платта: sigmoid(scale * margin + bias)"""
+    scale, bias = calibration
+    return torch.sigmoid(scale * torch.tensor(margins, dtype=torch.float64) + bias).tolist()
+
+def fit_calibration(margins, labels, steps=100):
+    """Подбирает (scale, bias) по размеченным строкам, labels - 1 для 'да' и 0 для 'нет'"""
+    margins = torch.tensor(margins, dtype=torch.float64)
+    labels = torch.tensor(labels, dtype=torch.float64)
+    params = torch.tensor([1.0, 0.0], dtype=torch.float64, requires_grad=True)
+    optimizer = torch.optim.LBFGS([params], max_iter=steps)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = torch.nn.functional.binary_cross_entropy_with_logits(params[0] * margins + params[1], labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return tuple(params.detach().tolist())
 
-def batch_process(df, tokenizer, model, device, site_profile, batch_size=100):
+def run_sorted_batches(prompts, tokenizer, batch_size, process):
+    """
+    Строки сортируются по длине промпта, чтобы в батч попадали промпты близкой длины
+    и паддинга было меньше. Результаты возвращаются в исходном порядке строк.
+    """
+    if not prompts:
+        return []
+    lengths = [len(ids) for ids in tokenizer(prompts)["input_ids"]]
+    order = sorted(range(len(prompts)), key=lengths.__getitem__)
+    results = [None] * len(prompts)
+
+    for i in tqdm(range(0, len(order), batch_size), desc="Обработка батчей"):
+        indices = order[i:i+batch_size]
+        batch_results = process([prompts[j] for j in indices])
+        for j, result in zip(indices, batch_results):
+            results[j] = result
+
+    return results
+
+def batch_process(df, tokenizer, model, device, site_profile, batch_size=16, num_threads=None):
     """Обработка данных батчами для лучшей производительности"""
-    results = []
-
-    for i in tqdm(range(0, len(df), batch_size), desc="Обработка батчей"):
-        batch = df.iloc[i:i+batch_size]
-        batch_results = []
-
-        for _, row in batch.iterrows():
-            result = zero_shot_classify(
-                row['title'],
-                row['description'],
-                site_profile,
-                tokenizer,
-                model,
-                device
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    prompts = [build_prompt(title, description, site_profile)
+               for title, description in zip(df['title'], df['description'])]
+    return run_sorted_batches(prompts, tokenizer, batch_size,
+                              lambda batch: classify_batch(batch, tokenizer, model, device))
+
+class ResultCache:
+    """
+    Постоянный кэш оценок на SQLite. Ключ - хеш нормализованных заголовка, описания,
+    site_profile, имени модели, backend и шаблона запроса, значение - разность логарифмов
+    вероятностей 'да'/'нет', поэтому смена калибровки или порога не сбрасывает кэш, а смена
+    backend или правка build_prefix/build_suffix - сбрасывает. При превышении max_entries
+    удаляются записи, которые дольше всего не использовались.
+    """
+
+    def __init__(self, path, model_name, backend="fp32", max_entries=1_000_000):
+        self.model_name = model_name
+        self.backend = backend
+        self.prompt_digest = hashlib.sha256(build_prompt("{t}", "{d}", "{p}").encode("utf-8")).hexdigest()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, margin REAL, last_used REAL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _normalize(value):
+        return re.sub(r"\s+", " ", str(value)).strip()
+
+    def key(self, title, description, site_profile):
+        parts = [self._normalize(part) for part in (title, description, site_profile)]
+        parts += [self.model_name, self.backend, self.prompt_digest]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def peek_many(self, keys):
+        """Поиск без отметки об использовании и без учёта в статистике"""
+        found = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), 500):
+            chunk = unique_keys[i:i + 500]
+            rows = self.connection.execute(
+                f"SELECT key, margin FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
             )
-            batch_results.append(result)
+            found.update(rows)
+        return found
 
-        results.extend(batch_results)
+    def get_many(self, keys):
+        found = self.peek_many(keys)
+        with self.connection:
+            self.connection.executemany("UPDATE scores SET last_used = ? WHERE key = ?",
+                                        [(time.time(), key) for key in found])
+        self.hits += sum(key in found for key in keys)
+        self.misses += sum(key not in found for key in keys)
+        return found
 
-    return results
+    def put_many(self, items):
+        # NaN (ошибка модели) не кэшируем, чтобы строка пересчиталась в следующий раз
+        rows = [(key, margin, time.time()) for key, margin in items if margin == margin]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?)", rows)
+            self._evict()
+
+    def _evict(self):
+        count, = self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        logger.info(f"Кэш результатов: {self.hits} попаданий, {self.misses} промахов ({rate:.1%})")
+
+    def close(self):
+        self.connection.close()
+
+def batch_score(df, tokenizer, model, device, site_profile, batch_size=16, num_threads=None,
+                calibration=(1.0, 0.0), prefix_cache=None, cache=None):
+    """
+    Режим оценки: вероятность ответа 'да' для каждой строки за один прямой проход.
+    С prefix_cache модель прогоняется только по части промпта, зависящей от строки.
+    С cache (ResultCache) модель запускается только для строк, которых нет в кэше.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    rows = list(zip(df['title'], df['description']))
+    keys = found = None
+    if cache is not None:
+        keys = [cache.key(title, description, site_profile) for title, description in rows]
+        found = cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+    else:
+        missing = list(range(len(rows)))
+
+    if not missing:
+        # Все строки нашлись в кэше, модель не нужна
+        computed = []
+    elif prefix_cache is not None:
+        suffixes = [build_suffix(*rows[i]) for i in missing]
+        computed = run_sorted_batches(suffixes, tokenizer, batch_size, lambda batch: score_suffix_batch(
+            batch, prefix_cache, site_profile, tokenizer, model, device))
+    else:
+        prompts = [build_prompt(*rows[i], site_profile) for i in missing]
+        computed = run_sorted_batches(prompts, tokenizer, batch_size,
+                                      lambda batch: score_batch(batch, tokenizer, model, device))
+
+    if cache is None:
+        return margins_to_probabilities(computed, calibration)
+    cache.put_many((keys[i], margin) for i, margin in zip(missing, computed))
+    margins = [found.get(key) for key in keys]
+    for i, margin in zip(missing, computed):
+        margins[i] = margin
+    return margins_to_probabilities(margins, calibration)
+
+def label_probabilities(probabilities, threshold=0.5):
+    return ["ошибка" if p != p else ("да" if p >= threshold else "нет") for p in probabilities]
+
+def _benchmark_backend(model_name, backend, df, site_profile, num_threads, queue):
+    """Выполняется в отдельном процессе, чтобы пиковая память считалась для каждого backend отдельно"""
+    from benchmark import memory_mb
+
+    try:
+        start = time.perf_counter()
+        tokenizer, model, device = load_model(model_name, backend=backend, num_threads=num_threads)
+        startup = time.perf_counter() - start
+        start = time.perf_counter()
+        probabilities = batch_score(df, tokenizer, model, device, site_profile,
+                                    prefix_cache=PrefixCache(tokenizer, model, device))
+        elapsed = time.perf_counter() - start
+    except Exception as e:
+        queue.put({"error": repr(e)})
+        return
+    # Пик VmHWM нового процесса - загрузка и оценка именно этим backend (ru_maxrss показал бы пик родителя)
+    peak_rss = memory_mb("VmHWM")
+    queue.put({"startup_s": startup, "rows_per_s": len(df) / elapsed, "peak_rss_mb": peak_rss,
+               "probabilities": probabilities})
+
+def wait_for_result(process, queue, timeout):
+    """
+    Результат процесса из очереди или None, если процесс завершился, ничего не отдав
+    (например, убит по нехватке памяти), или не уложился в timeout секунд.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                # Результат мог попасть в очередь между проверками
+                try:
+                    return queue.get(timeout=1)
+                except Empty:
+                    return None
+            if time.monotonic() > deadline:
+                process.terminate()
+                return None
+
+def benchmark_backends(model_name, df, site_profile, backends=("fp32", "int8"), sample_size=200,
+                       threshold=0.5, num_threads=None, seed=0, timeout=3600):
+    """
+    Сравнивает backend'ы на отложенной выборке: время запуска, строк в секунду, пиковая память
+    и согласие с fp32 (доля совпавших ответов и средняя разница вероятностей).
+    Упавший или не уложившийся в timeout секунд backend записывается со status="failed".
+    """
+    sample = df.sample(min(sample_size, len(df)), random_state=seed)
+    context = multiprocessing.get_context("spawn")
+    report = {}
+    for backend in backends:
+        queue = context.Queue()
+        process = context.Process(target=_benchmark_backend,
+                                  args=(model_name, backend, sample, site_profile, num_threads, queue))
+        process.start()
+        stats = wait_for_result(process, queue, timeout)
+        process.join()
+        if stats is None or "error" in stats:
+            error = stats["error"] if stats else "процесс завершился без результата или по таймауту"
+            report[backend] = {"status": "failed", "exitcode": process.exitcode, "error": error}
+            logger.error(f"{backend}: не выполнен, код завершения {process.exitcode}: {error}")
+            continue
+        report[backend] = dict(stats, status="ok")
+
+    reference = report.get("fp32")
+    if reference is not None and reference["status"] == "failed":
+        reference = None
+    for backend, stats in report.items():
+        if stats["status"] == "failed":
+            continue
+        if reference is not None:
+            labels = label_probabilities(stats["probabilities"], threshold)
+            reference_labels = label_probabilities(reference["probabilities"], threshold)
+            stats["agreement"] = sum(a == b for a, b in zip(labels, reference_labels)) / len(labels)
+            stats["mean_abs_diff"] = sum(abs(a - b) for a, b in zip(stats["probabilities"], reference["probabilities"])) / len(labels)
+        logger.info(f"{backend}: запуск {stats['startup_s']:.1f} с, {stats['rows_per_s']:.1f} строк/с, "
+                    f"пик памяти {stats['peak_rss_mb']:.0f} МБ, согласие с fp32 {stats.get('agreement', float('nan')):.1%}")
+    return report
 
 def main():
     try:
+        # Файлы конвейера: .parquet/.feather или CSV с разделителем '|'
+        input_path = "filtered_output.csv"
+        output_path = "classified_output.csv"
+
         # Загрузка данных
         logger.info("Загрузка данных...")
-        df = pd.read_csv("filtered_output.csv", sep="|")
+        df = read_table(input_path)
         logger.info(f"Загружено {df.shape[0]} записей")
 
         # Параметры классификации
         site_profile = "Оптовый продавец или дистрибьютор обуви"
         model_name = "sberbank-ai/rugpt3small_based_on_gpt2"
+        threshold = 0.5
+        # Первый уровень включается, только если на отложенных строках согласен с моделью не реже
+        min_agreement = 0.95
+        backend = "fp32"  # "int8" на CPU, согласие с fp32 проверяется benchmark_backends
 
         # Загрузка модели
-        tokenizer, model, device = load_model(model_name)
+        tokenizer, model, device = load_model(model_name, backend=backend)
 
         # Классификация
         logger.info("Начало классификации...")
-        df['classification'] = batch_process(df, tokenizer, model, device, site_profile)
+        prefix_cache = PrefixCache(tokenizer, model, device)
+        cache = ResultCache("classifier_cache.sqlite", model_name, backend=backend)
+
+        def score_rows(rows):
+            return batch_score(rows, tokenizer, model, device, site_profile, prefix_cache=prefix_cache, cache=cache)
+
+        # Если есть разметка прошлого запуска, уверенные строки решает быстрый первый уровень
+        pre_classifier = None
+        if os.path.exists(output_path):
+            pre_classifier = PreClassifier.from_classified(output_path, threshold=threshold)
+        if pre_classifier is not None and not pre_classifier.agreement >= min_agreement:
+            logger.warning(f"Предклассификатор отключён: согласие {pre_classifier.agreement:.1%} "
+                           f"ниже {min_agreement:.0%}")
+            pre_classifier = None
+        if pre_classifier is not None:
+            df['confidence'], escalated = tiered_score(df, pre_classifier, score_rows, threshold=threshold)
+            df['tier'] = ["llm" if flag else "pre" for flag in escalated]
+        else:
+            df['confidence'] = score_rows(df)
+        df['classification'] = label_probabilities(df['confidence'], threshold)
+        # Ответ языковой модели для всех строк, чья оценка есть в кэше (в том числе решённых
+        # первым уровнем): на них обучается предклассификатор следующего запуска
+        keys = [cache.key(title, description, site_profile) for title, description in zip(df['title'], df['description'])]
+        margins = cache.peek_many(keys)
+        df['llm_confidence'] = margins_to_probabilities([margins.get(key, float("nan")) for key in keys])
 
         # Сохранение результатов
-        df.to_csv("classified_output.csv", sep="|", index=False, encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
+        write_table(df, output_path)
 
         # Статистика результатов
         yes_count = (df['classification'] == 'да').sum()
@@ -107,7 +520,9 @@ def main():
         error_count = (df['classification'] == 'ошибка').sum()
 
         logger.info(f"Классификация завершена: {yes_count} - да, {no_count} - нет, {error_count} - ошибки")
-        logger.info(f"Результаты сохранены в 'classified_output.csv'")
+        logger.info(f"Результаты сохранены в '{output_path}'")
+        cache.log_stats()
+        cache.close()
 
     except Exception as e:
         logger.error(f"Произошла ошибка: {e}")
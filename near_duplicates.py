@@ -0,0 +1,94 @@
+import hashlib
+
+import numpy as np
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+
+    def find(self, item: int) -> int:
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+    def labels(self) -> np.ndarray:
+        return np.array([self.find(item) for item in range(len(self.parent))])
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """64-битные хеши символьных n-грамм текста после схлопывания пробелов"""
+    text = " ".join(text.lower().split())
+    if len(text) < size:
+        return np.empty(0, dtype=np.uint64)
+    return np.unique(np.fromiter(
+        (int.from_bytes(hashlib.blake2b(text[i:i + size].encode("utf-8"), digest_size=8).digest(), "little")
+         for i in range(len(text) - size + 1)),
+        dtype=np.uint64,
+    ))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    Финализатор splitmix64: взаимно однозначное перемешивание 64-битных чисел.
+    Умножения в uint64 идут с переполнением по модулю 2^64, как и задумано.
+    """
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def minhash_signatures(texts, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+    """
+    MinHash-подписи текстов. Каждая перестановка - XOR хеша n-граммы со своей случайной
+    64-битной маской и перемешивание _mix, поэтому минимумы разных перестановок независимы.
+    Строки без единой n-граммы получают None и в сравнении по тексту не участвуют.
+    """
+    rng = np.random.default_rng(seed)
+    masks = rng.integers(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64, endpoint=True)
+    signatures = []
+    for text in texts:
+        hashes = shingles(text, shingle_size)
+        if not len(hashes):
+            signatures.append(None)
+            continue
+        signatures.append(_mix(hashes[:, None] ^ masks).min(axis=0))
+    return signatures
+
+
+def near_duplicate_pairs(signatures, bands: int = 16, threshold: float = 0.8):
+    """
+    Пары похожих текстов через LSH: подпись режется на полосы, тексты с совпавшей
+    полосой становятся кандидатами и сравниваются с первым текстом корзины по
+    оценке сходства Жаккара. Число сравнений растёт линейно, а не квадратично.
+    """
+    rows = None
+    buckets = {}
+    for item, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        rows = rows or len(signature) // bands
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            buckets.setdefault(key, []).append(item)
+
+    seen = set()
+    for members in buckets.values():
+        representative = members[0]
+        for item in members[1:]:
+            pair = (representative, item)
+            if pair in seen:
+                continue
+            seen.add(pair)
+            if np.mean(signatures[representative] == signatures[item]) >= threshold:
+                yield pair
@@ -1,21 +1,31 @@
-import csv
 import time
+import sqlite3
+import threading
 import pandas as pd
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from apify_client import ApifyClient
 import numpy as np
 import requests
 
-def create_responses() -> list:
-    response = pd.read_csv('response.csv', header=None).iloc[:, 0].values
-    cities = pd.read_csv('cities.csv', header=None).iloc[:, 0].values
+from table_io import TableWriter
+
+APIFY_API_URL = "https://api.apify.com"
+
+def create_responses(response_path: str = 'response.csv', cities_path: str = 'cities.csv') -> list:
+    response = pd.read_csv(response_path, header=None).iloc[:, 0].values
+    cities = pd.read_csv(cities_path, header=None).iloc[:, 0].values
     responses = np.array([[x, y] for x in response for y in cities])
     return responses
 
-def create_dataset(response:str) -> str:
-    with open("token.txt", "r") as file:
+def load_client(token_path: str = "token.txt", api_url: str = APIFY_API_URL) -> ApifyClient:
+    with open(token_path, "r") as file:
         token = file.read().strip()
-    client = ApifyClient(token)
+    return ApifyClient(token, api_url=api_url)
+
+def create_dataset(response: str, client: ApifyClient = None, api_url: str = APIFY_API_URL) -> str:
+    if client is None:
+        client = load_client(api_url=api_url)
     run_input = {
     "focusOnPaidAds": False,
     "countryCode": "uz",
@@ -32,13 +42,10 @@ def create_dataset(response:str) -> str:
     }
     run = client.actor("apify/google-search-scraper").call(run_input=run_input)
     dataset_id = run['defaultDatasetId']
-    url = f"https://api.apify.com/v2/datasets/{dataset_id}/items?format=json&fields=searchQuery,organicResults&unwind=organicResults"
+    url = f"{api_url}/v2/datasets/{dataset_id}/items?format=jsonl&fields=searchQuery,organicResults&unwind=organicResults"
     return url
 
-def parse_result(url: str) -> pd.DataFrame:
-    with requests.get(url) as response:
-        json_data = response.json()
-
+def parse_result(url: str, session=requests, timeout: float = 60, keep_search_term: bool = False) -> pd.DataFrame:
     field_mapings = {
         "position": lambda item: item.get("position", None),
         "title": lambda item: item.get("title", None),
@@ -48,37 +55,204 @@ def parse_result(url: str) -> pd.DataFrame:
             item.get("emphasizedKeywords"), list) else None
 
     }
+    if keep_search_term:
+        # После unwind каждый результат несёт searchQuery запроса, из которого он получен
+        field_mapings["search_term"] = lambda item: (item.get("searchQuery") or {}).get("term")
 
-    df_dict = {field: [maping(item) for item in json_data] for field, maping in field_mapings.items()}
+    # Набор данных читается построчно (format=jsonl): в памяти одновременно
+    # только один результат, все поля извлекаются за один проход
+    df_dict = {field: [] for field in field_mapings}
+    with session.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            for field, maping in field_mapings.items():
+                df_dict[field].append(maping(item))
     return pd.DataFrame(df_dict)
 
-def make_response(response: str) -> pd.DataFrame:
+def make_response(response: str, client: ApifyClient = None, session=requests, api_url: str = APIFY_API_URL) -> pd.DataFrame:
     query, city = response
-    link_result = create_dataset(f"{query} {city}")
-    df = parse_result(link_result)
+    link_result = create_dataset(f"{query} {city}", client=client, api_url=api_url)
+    df = parse_result(link_result, session=session)
     df['query'] = query
     df['city'] = city
     return df
 
+def make_batch_response(batch, client: ApifyClient = None, session=requests, api_url: str = APIFY_API_URL) -> list:
+    """
+    Один запуск актора на несколько пар (запрос, город): запросы передаются через перевод строки,
+    результаты раскладываются обратно по парам по полю searchQuery.term.
+    Возвращает список (пара, df) для каждой пары пакета, в том числе с пустым df.
+    """
+    if len(batch) == 1:
+        return [(batch[0], make_response(batch[0], client=client, session=session, api_url=api_url))]
+
+    terms = [f"{query} {city}" for query, city in batch]
+    link_result = create_dataset("\n".join(terms), client=client, api_url=api_url)
+    df = parse_result(link_result, session=session, keep_search_term=True)
+    term_index = {term.strip().lower(): i for i, term in enumerate(terms)}
+    pair_index = df.pop("search_term").fillna("").str.strip().str.lower().map(term_index)
+    if pair_index.isna().any():
+        print(f"Skipped {pair_index.isna().sum()} results with unknown search term")
+
+    results = []
+    for i, (query, city) in enumerate(batch):
+        pair_df = df[pair_index == i].reset_index(drop=True)
+        pair_df['query'] = query
+        pair_df['city'] = city
+        results.append((batch[i], pair_df))
+    return results
+
+
+class RateLimiter:
+    """Не даёт запускать запросы чаще, чем rate раз в секунду, на все потоки сразу"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def with_retries(func, retries: int = 3, backoff: float = 2.0, limiter: RateLimiter = None):
+    """Повторяет вызов при ошибке с экспоненциальной задержкой backoff, 2*backoff, ..."""
+    def wrapper(*args, **kwargs):
+        for attempt in range(retries + 1):
+            if limiter is not None:
+                limiter.wait()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt
+                print(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    return wrapper
+
+
+def run_responses(responses, on_result, client: ApifyClient = None, session=None, api_url: str = APIFY_API_URL,
+                  max_workers: int = 4, retries: int = 3, backoff: float = 2.0, rate: float = 1.0,
+                  batch_size: int = 1, on_failure=None) -> list:
+    """
+    Выполняет запросы параллельно, не более max_workers одновременно и не чаще rate в секунду.
+    При batch_size > 1 в один запуск актора упаковывается до batch_size пар.
+    Результаты передаются в on_result(response, df), ошибки в on_failure(response, error),
+    оба вызываются из одного (текущего) потока.
+    Возвращает список запросов, которые не удались после всех повторов.
+    """
+    client = client or load_client(api_url=api_url)
+    session = session or requests.Session()
+    fetch = with_retries(make_batch_response, retries=retries, backoff=backoff, limiter=RateLimiter(rate))
+    batches = [responses[i:i + batch_size] for i in range(0, len(responses), batch_size)]
+    failed_responses = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, batch, client, session, api_url): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failed_responses.extend(batch)
+                print(f"Batch of {len(batch)} responses failed: {e}")
+                if on_failure is not None:
+                    for response in batch:
+                        on_failure(response, e)
+                continue
+            for response, df in results:
+                on_result(response, df)
+    return failed_responses
+
+
+class Checkpoint:
+    """
+    Журнал результатов в SQLite: строки каждой пары дописываются вместе с отметкой
+    в манифесте одной транзакцией, поэтому после падения теряется не больше пары.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "key TEXT PRIMARY KEY, query TEXT, city TEXT, status TEXT, error TEXT, updated_at REAL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def key(response) -> str:
+        query, city = response
+        return f"{query}\t{city}"
+
+    def completed(self) -> set:
+        return {key for key, in self.connection.execute("SELECT key FROM manifest WHERE status = 'done'")}
+
+    def failed(self) -> list:
+        return self.connection.execute("SELECT query, city, error FROM manifest WHERE status = 'failed'").fetchall()
+
+    def pending(self, responses) -> list:
+        completed = self.completed()
+        return [response for response in responses if self.key(response) not in completed]
+
+    def _mark(self, response, status: str, error: str = None):
+        query, city = response
+        self.connection.execute(
+            "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?)",
+            (self.key(response), str(query), str(city), status, error, time.time())
+        )
+
+    def add(self, response, df: pd.DataFrame):
+        with self.connection:
+            df.assign(key=self.key(response)).to_sql("results", self.connection, if_exists="append", index=False)
+            self._mark(response, "done")
+
+    def mark_failed(self, response, error: Exception):
+        with self.connection:
+            self._mark(response, "failed", str(error))
+
+    def export(self, path: str, chunksize: int = 100_000) -> int:
+        """
+        Собирает итоговый файл одним потоковым проходом по журналу.
+        Формат по расширению: .parquet/.feather (query и city как категории) или CSV.
+        """
+        tables = self.connection.execute("SELECT name FROM sqlite_master WHERE name = 'results'").fetchall()
+        with TableWriter(path) as writer:
+            if not tables:
+                writer.write(pd.DataFrame())
+                return 0
+            chunks = pd.read_sql_query("SELECT * FROM results ORDER BY rowid", self.connection, chunksize=chunksize)
+            for chunk in chunks:
+                writer.write(chunk.drop(columns="key"))
+        return writer.rows
+
+    def close(self):
+        self.connection.close()
+
 
 def main():
     responses = create_responses()
-    print(f"Total responses: {len(responses)}")
-    dataframe = pd.DataFrame()
-    failed_responses = []
-    for i, response in enumerate(responses):
-        try:
-            df = make_response(response)
-            dataframe = pd.concat([dataframe, df], ignore_index=True)
-            print(f"Response {i} has been ended successfully: {response}")
-            if i % 10 == 0 and i != 0:
-                dataframe.to_csv("data_frame_csv/partial_output.csv", index=False, sep="|", encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
-        except requests.exceptions.HTTPError as e:
-            failed_responses.append(response)
-            print(f"HTTP error occurred: {e}")
-    dataframe.to_csv(f"data_frame_csv/crude_base_uz.csv", index=False, sep="|", encoding="utf-8-sig", quoting=csv.QUOTE_ALL)
-    print(failed_responses)
+    checkpoint = Checkpoint("data_frame_csv/crude_base_uz.sqlite")
+    pending = checkpoint.pending(responses)
+    print(f"Total responses: {len(responses)}, already done: {len(responses) - len(pending)}")
+
+    def save_result(response, df):
+        checkpoint.add(response, df)
+        print(f"Response has been ended successfully: {response} ({len(df)} results)")
+
+    run_responses(pending, save_result, batch_size=10, on_failure=checkpoint.mark_failed)
+    total = checkpoint.export("data_frame_csv/crude_base_uz.parquet")
+    print(f"Saved {total} results")
+    print(checkpoint.failed())
+    checkpoint.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,156 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Литералы короче этого слишком часто встречаются, чтобы отсекать по ним ячейки
+MIN_LITERAL_LENGTH = 2
+
+
+def _best_literals(candidates):
+    """Выбирает набор литералов с самым длинным коротким элементом"""
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (min(map(len, c)), -len(c)))
+
+
+def _required_literals(subpattern):
+    """
+    Возвращает множество строк, хотя бы одна из которых обязана входить
+    в любое совпадение подвыражения, или None, если такое множество не вывести.
+    """
+    candidates = []
+    run = []
+
+    def flush():
+        if run:
+            candidates.append({"".join(run)})
+            run.clear()
+
+    for op, av in subpattern:
+        name = str(op)
+        if name == "LITERAL":
+            run.append(chr(av))
+            continue
+        if name == "AT":
+            # Якоря (\b, ^, $) не поглощают символы и не разрывают литерал
+            continue
+        flush()
+        if name == "SUBPATTERN":
+            candidates.append(_required_literals(av[-1]))
+        elif name == "BRANCH":
+            branches = [_required_literals(branch) for branch in av[1]]
+            if all(branches):
+                candidates.append(set().union(*branches))
+        elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            low, _, item = av
+            if low >= 1:
+                candidates.append(_required_literals(item))
+    flush()
+    return _best_literals(candidates)
+
+
+def extract_literals(pattern: str, flags: int = 0):
+    """Обязательные литералы шаблона (в нижнем регистре) либо None"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    literals = _required_literals(parsed)
+    if not literals or min(map(len, literals)) < MIN_LITERAL_LENGTH:
+        return None
+    return {literal.lower() for literal in literals}
+
+
+def _trie_regex(words) -> str:
+    """Собирает из слов регулярку-префиксное дерево с жадным выбором самого длинного слова"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class PatternMatcher:
+    """
+    Набор регулярных выражений, который компилируется один раз и проверяет ячейку
+    за один проход литерального префильтра. Регулярка шаблона запускается только
+    если в тексте нашёлся хотя бы один из его обязательных литералов.
+    """
+
+    def __init__(self, patterns, flags: int = re.IGNORECASE):
+        self.patterns = list(patterns)
+        self.flags = flags
+        self.compiled = [re.compile(pattern, flags) for pattern in self.patterns]
+
+        # Шаблоны без выводимых литералов проверяются всегда
+        self._always = []
+        literal_ids = {}
+        for pattern_id, pattern in enumerate(self.patterns):
+            literals = extract_literals(pattern, flags)
+            if literals is None:
+                self._always.append(pattern_id)
+                continue
+            for literal in literals:
+                literal_ids.setdefault(literal, set()).add(pattern_id)
+
+        # Префильтр находит в каждой позиции самый длинный литерал,
+        # поэтому литералу приписываются и шаблоны всех его префиксов
+        self._literal_ids = {
+            literal: frozenset().union(*(ids for prefix, ids in literal_ids.items() if literal.startswith(prefix)))
+            for literal in literal_ids
+        }
+        self._all_literal_ids = frozenset().union(*literal_ids.values()) if literal_ids else frozenset()
+        self._prefilter = None
+        if literal_ids:
+            self._prefilter = re.compile("(?=(" + _trie_regex(literal_ids) + "))", re.IGNORECASE)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _candidates(self, text: str):
+        candidates = set(self._always)
+        if self._prefilter is not None:
+            for match in self._prefilter.finditer(text):
+                # Регистронезависимое совпадение может не совпасть с ключом после lower(),
+                # тогда проверяем все шаблоны с литералами
+                candidates.update(self._literal_ids.get(match.group(1).lower(), self._all_literal_ids))
+                if len(candidates) == len(self.patterns):
+                    break
+        return sorted(candidates)
+
+    def first_match(self, text) -> int:
+        """Номер первого по порядку совпавшего шаблона или -1"""
+        if not isinstance(text, str):
+            return -1
+        for pattern_id in self._candidates(text):
+            if self.compiled[pattern_id].search(text):
+                return pattern_id
+        return -1
+
+    def match_ids(self, text) -> list:
+        """Номера всех совпавших шаблонов"""
+        if not isinstance(text, str):
+            return []
+        return [pattern_id for pattern_id in self._candidates(text) if self.compiled[pattern_id].search(text)]
+
+    def first_matches(self, values) -> list:
+        return [self.first_match(value) for value in values]
+
+    def all_matches(self, values) -> list:
+        return [self.match_ids(value) for value in values]
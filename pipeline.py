@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from table_io import read_table, write_table
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_digest(path: str):
+    """sha256 содержимого файла или None, если файла нет"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_digest(modules) -> str:
+    """Версия кода стадии - хеш исходников её модулей (незакоммиченные правки тоже учитываются)"""
+    digest = hashlib.sha256()
+    for module in sorted(modules):
+        digest.update(module.encode("utf-8"))
+        digest.update((file_digest(os.path.join(BASE_DIR, module)) or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def config_digest(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def row_hashes(df: pd.DataFrame, columns) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[list(columns)].astype(str), index=False).to_numpy()
+
+
+class Stage:
+    """
+    Шаг конвейера: run(inputs, output, config, previous_rows) -> словарь метрик
+    (rows_in, rows_new, rows_out). key_columns - столбцы, по которым строки первого входа
+    узнаются при следующем запуске; если они заданы, при неизменных коде и config стадия
+    получает в previous_rows хеши уже обработанных строк и может обработать только новые.
+    append_only - прежний выход годится, только если все прежние строки входа на месте.
+    always_run - стадия сама решает, есть ли работа (например, сбор выдачи по журналу).
+    """
+
+    def __init__(self, name: str, run, inputs, output: str, config: dict = None, modules=(),
+                 key_columns=None, append_only: bool = False, always_run: bool = False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.output = output
+        self.config = config or {}
+        self.modules = list(modules) + ["pipeline.py"]
+        self.key_columns = key_columns
+        self.append_only = append_only
+        self.always_run = always_run
+
+
+class Pipeline:
+    """
+    Последовательный запуск стадий с отпечатками: хеш входных файлов, config и кода.
+    Стадия с прежним отпечатком и нетронутым выходом пропускается. Если поменялись только
+    входы, а прежние строки входа все на месте, стадия работает в инкрементальном режиме.
+    Состояние и метрики хранятся в state_dir (state.json, <стадия>.rows.npy, metrics.jsonl).
+    """
+
+    def __init__(self, stages, state_dir: str = "pipeline_state"):
+        self.stages = stages
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, "state.json")
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as file:
+                self.state = json.load(file)
+
+    def _rows_path(self, stage: Stage) -> str:
+        return os.path.join(self.state_dir, f"{stage.name}.rows.npy")
+
+    def _save_state(self):
+        with open(self.state_path, "w", encoding="utf-8") as file:
+            json.dump(self.state, file, ensure_ascii=False, indent=2)
+
+    def _emit(self, metrics: dict):
+        line = json.dumps(metrics, ensure_ascii=False)
+        logger.info(line)
+        with open(os.path.join(self.state_dir, "metrics.jsonl"), "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    def fingerprint(self, stage: Stage) -> dict:
+        return {
+            "config": config_digest(stage.config),
+            "code": code_digest(stage.modules),
+            "inputs": {path: file_digest(path) for path in stage.inputs},
+        }
+
+    def _previous_rows(self, stage: Stage, previous: dict, fingerprint: dict, input_rows):
+        """Хеши строк прошлого запуска, если стадию можно выполнить только по новым строкам"""
+        if (input_rows is None or previous is None
+                or previous["fingerprint"]["config"] != fingerprint["config"]
+                or previous["fingerprint"]["code"] != fingerprint["code"]
+                or file_digest(stage.output) != previous["output"]
+                or not os.path.exists(self._rows_path(stage))):
+            return None
+        previous_rows = np.load(self._rows_path(stage))
+        # Если строки из входа пропали, старый выход уже не согласован с ним
+        if stage.append_only and not np.isin(previous_rows, input_rows).all():
+            return None
+        return previous_rows
+
+    def run_stage(self, stage: Stage, force: bool = False) -> dict:
+        fingerprint = self.fingerprint(stage)
+        previous = self.state.get(stage.name)
+        metrics = {"stage": stage.name, "started_at": time.time()}
+        start = time.perf_counter()
+
+        missing = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing:
+            logger.warning(f"Стадия {stage.name} пропущена, нет входных файлов: {', '.join(missing)}")
+            metrics.update(status="missing_input", seconds=0.0, missing=missing)
+            self._emit(metrics)
+            return metrics
+
+        if (not force and not stage.always_run and previous is not None
+                and previous["fingerprint"] == fingerprint and file_digest(stage.output) == previous["output"]):
+            metrics.update(status="skipped", seconds=time.perf_counter() - start, rows_out=previous.get("rows_out"))
+            self._emit(metrics)
+            return metrics
+
+        input_rows = None
+        if stage.key_columns is not None:
+            input_rows = np.unique(row_hashes(read_table(stage.inputs[0], columns=stage.key_columns),
+                                              stage.key_columns))
+        previous_rows = None if force else self._previous_rows(stage, previous, fingerprint, input_rows)
+
+        try:
+            result = stage.run(stage.inputs, stage.output, stage.config, previous_rows)
+        except Exception as e:
+            metrics.update(status="failed", seconds=time.perf_counter() - start, error=str(e))
+            self._emit(metrics)
+            raise
+        if input_rows is not None:
+            np.save(self._rows_path(stage), input_rows)
+        # Стадия может сама отказаться от инкрементального режима и вернуть status="full"
+        status = result.pop("status", "incremental" if previous_rows is not None else "full")
+        metrics.update(result)
+        metrics.update(status=status, seconds=time.perf_counter() - start)
+        self.state[stage.name] = {"fingerprint": fingerprint, "output": file_digest(stage.output),
+                                  "rows_out": result.get("rows_out"), "finished_at": time.time()}
+        self._save_state()
+        self._emit(metrics)
+        return metrics
+
+    def run(self, force=()) -> list:
+        """force - имена стадий, которые надо пересчитать целиком независимо от отпечатков"""
+        return [self.run_stage(stage, force=stage.name in force) for stage in self.stages]
+
+
+def scrape_stage(inputs, output, config, previous_rows=None) -> dict:
+    """Запросы из журнала Checkpoint, которые ещё не выполнены, затем выгрузка журнала"""
+    from parse_google_search import Checkpoint, create_responses, run_responses
+
+    responses = create_responses(*inputs)
+    checkpoint = Checkpoint(config["checkpoint"])
+    pending = checkpoint.pending(responses)
+    if pending:
+        run_responses(pending, checkpoint.add, batch_size=config["batch_size"], on_failure=checkpoint.mark_failed)
+    # Без новых результатов выгрузка не переписывается, чтобы не трогать отпечатки следующих стадий
+    if pending or not os.path.exists(output):
+        rows = checkpoint.export(output)
+    else:
+        rows = len(read_table(output, columns=["url"]))
+    failed = len(checkpoint.failed())
+    checkpoint.close()
+    return {"pairs": len(responses), "pairs_new": len(pending), "rows_out": rows, "failed": failed}
+
+
+def filter_stage(inputs, output, config, previous_rows=None) -> dict:
+    """
+    DataFilter по выдаче. Рядом с выходом хранится результат до схлопывания похожих строк
+    (<выход>.unique.<расширение>). В инкрементальном режиме фильтруются только новые строки,
+    адреса прежних строк считаются уже встреченными, а схлопывание повторяется по всему
+    сохранённому результату, поэтому выход совпадает с полным пересчётом.
+    """
+    from DataFilter import DataFilter, SeenUrls
+
+    root, extension = os.path.splitext(output)
+    unique_path = f"{root}.unique{extension}"
+    if not os.path.exists(unique_path):
+        previous_rows = None
+    df = read_table(inputs[0])
+    new = np.ones(len(df), dtype=bool)
+    if previous_rows is not None:
+        new = ~np.isin(row_hashes(df, config["key_columns"]), previous_rows)
+
+    data_filter = DataFilter(df[new].reset_index(drop=True), red_flags=config["red_flags"], locale=config["locale"])
+    if previous_rows is not None:
+        data_filter.seen_urls = SeenUrls()
+        data_filter.seen_urls.check_and_add(df.loc[~new, "url"])
+    filtered = data_filter.apply_all()
+    if previous_rows is not None:
+        filtered = pd.concat([read_table(unique_path), filtered], ignore_index=True)
+    write_table(filtered, unique_path)
+
+    result = DataFilter(filtered, green_flags=config["green_flags"])
+    if config["green_flags"]:
+        result.get_green_flags_count()
+    if config["near_duplicates"]:
+        result.drop_near_duplicates(by_domain=config["by_domain"])
+    write_table(result.df, output)
+    return {"rows_in": len(df), "rows_new": int(new.sum()), "rows_out": len(result.df),
+            "status": "incremental" if previous_rows is not None else "full"}
+
+
+def score_stage(inputs, output, config, previous_rows=None) -> dict:
+    """
+    Вероятность 'да' языковой моделью. Оценки строк, уже бывших в прошлом выходе
+    (по заголовку и описанию), переносятся без запуска модели.
+    """
+    df = read_table(inputs[0])
+    confidence = pd.Series(np.nan, index=range(len(df)))
+    if previous_rows is not None:
+        previous = read_table(output, columns=["title", "description", "confidence"])
+        known = pd.Series(previous["confidence"].to_numpy(), index=row_hashes(previous, ["title", "description"]))
+        known = known[~known.index.duplicated()]
+        confidence = pd.Series(row_hashes(df, ["title", "description"])).map(known)
+
+    missing = confidence.isna().to_numpy()
+    if missing.any():
+        from classifier import PrefixCache, ResultCache, batch_score, load_model
+
+        tokenizer, model, device = load_model(config["model_name"], backend=config["backend"])
+        cache = ResultCache(config["cache"], config["model_name"], backend=config["backend"])
+        confidence[missing] = batch_score(df[missing], tokenizer, model, device, config["site_profile"],
+                                          batch_size=config["batch_size"],
+                                          prefix_cache=PrefixCache(tokenizer, model, device), cache=cache)
+        cache.log_stats()
+        cache.close()
+    df["confidence"] = confidence.to_numpy()
+    write_table(df, output)
+    return {"rows_in": len(df), "rows_new": int(missing.sum()), "rows_out": len(df)}
+
+
+def classify_stage(inputs, output, config, previous_rows=None) -> dict:
+    """Метки по порогу: дёшево, поэтому смена порога не пересчитывает оценки"""
+    from classifier import label_probabilities
+
+    df = read_table(inputs[0])
+    df["classification"] = label_probabilities(df["confidence"], config["threshold"])
+    write_table(df, output)
+    counts = df["classification"].value_counts()
+    return {"rows_in": len(df), "rows_new": len(df), "rows_out": len(df),
+            "yes": int(counts.get("да", 0)), "no": int(counts.get("нет", 0)), "errors": int(counts.get("ошибка", 0))}
+
+
+def validate_stage(inputs, output, config, previous_rows=None) -> dict:
+    from validate_phones.validate_phone import check_database
+
+    rows = check_database(inputs[0], output, cache_path=config["cache"])
+    return {"rows_in": rows, "rows_new": rows, "rows_out": rows}
+
+
+def default_stages(data_dir: str = "data_frame_csv") -> list:
+    """Цепочка сбор -> фильтр -> оценка -> классификация -> проверка телефонов с файлами в data_dir"""
+    from DataFilter import GREEN_FLAGS, RED_FLAGS
+
+    crude = os.path.join(data_dir, "crude_base_uz.parquet")
+    filtered = os.path.join(data_dir, "filtered_output.parquet")
+    scored = os.path.join(data_dir, "scored_output.parquet")
+    classified = os.path.join(data_dir, "classified_output.parquet")
+    filter_keys = ["url", "query", "city"]
+    filter_modules = ["DataFilter.py", "pattern_matcher.py", "url_normalizer.py", "near_duplicates.py",
+                      "rule_profiler.py", "table_io.py"]
+    return [
+        Stage("scrape", scrape_stage, ["response.csv", "cities.csv"], crude,
+              config={"checkpoint": os.path.join(data_dir, "crude_base_uz.sqlite"), "batch_size": 10},
+              modules=["parse_google_search.py", "table_io.py"], always_run=True),
+        Stage("filter", filter_stage, [crude], filtered,
+              config={"red_flags": RED_FLAGS, "green_flags": GREEN_FLAGS, "locale": None, "near_duplicates": True,
+                      "by_domain": False, "key_columns": filter_keys},
+              modules=filter_modules, key_columns=filter_keys, append_only=True),
+        Stage("score", score_stage, [filtered], scored,
+              config={"model_name": "sberbank-ai/rugpt3small_based_on_gpt2", "backend": "fp32",
+                      "site_profile": "Оптовый продавец или дистрибьютор обуви", "batch_size": 16,
+                      "cache": "classifier_cache.sqlite"},
+              modules=["classifier.py", "table_io.py"], key_columns=["title", "description"]),
+        Stage("classify", classify_stage, [scored], classified, config={"threshold": 0.5},
+              modules=["classifier.py", "table_io.py"]),
+        Stage("validate", validate_stage, ["database.csv"], "database_checked.csv",
+              config={"cache": "phone_cache.sqlite"}, modules=["validate_phones/validate_phone.py"]),
+    ]
+
+
+def main():
+    pipeline = Pipeline(default_stages())
+    pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import logging
+import time
+import zlib
+
+import numpy as np
+import torch
+
+from table_io import read_table
+
+logger = logging.getLogger(__name__)
+
+
+class PreClassifier:
+    """
+    Быстрый первый уровень перед языковой моделью: хешированные символьные n-граммы
+    заголовка и описания с весами TF-IDF плюс число зелёных флагов DataFilter,
+    поверх них логистическая регрессия. Строки с вероятностью ниже low или выше high
+    считаются решёнными, остальные отправляются в языковую модель.
+    """
+
+    def __init__(self, n_features=2 ** 18, ngram_range=(3, 5), low=0.1, high=0.9):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.low = low
+        self.high = high
+        self.idf = None
+        self.weights = None
+        self.bias = None
+        self.green_weight = None
+        # Заполняются validate: доля уверенных строк и совпадение их меток с языковой моделью
+        self.coverage = None
+        self.agreement = None
+
+    @staticmethod
+    def _texts(df):
+        return (df['title'].fillna("").astype(str) + " " + df['description'].fillna("").astype(str)).str.lower()
+
+    @staticmethod
+    def _green_counts(df):
+        if 'green_flags_count' not in df.columns:
+            return torch.zeros(len(df))
+        return torch.tensor(df['green_flags_count'].fillna(0).to_numpy(dtype=np.float32))
+
+    def _hashed_counts(self, texts):
+        """Номера корзин n-грамм каждой строки (crc32 стабилен между запусками, в отличие от hash)"""
+        rows, items = [], []
+        low, high = self.ngram_range
+        for row, text in enumerate(texts):
+            text = f" {text} "
+            buckets = {}
+            for n in range(low, high + 1):
+                for i in range(len(text) - n + 1):
+                    bucket = zlib.crc32(text[i:i + n].encode("utf-8")) % self.n_features
+                    buckets[bucket] = buckets.get(bucket, 0) + 1
+            rows.extend([row] * len(buckets))
+            items.extend(buckets.items())
+        return rows, items
+
+    def _features(self, df, fit=False):
+        rows, items = self._hashed_counts(self._texts(df))
+        indices = torch.tensor([rows, [bucket for bucket, _ in items]], dtype=torch.long)
+        values = torch.log1p(torch.tensor([count for _, count in items], dtype=torch.float32))
+        if fit:
+            document_frequency = torch.bincount(indices[1], minlength=self.n_features).float()
+            self.idf = torch.log((1 + len(df)) / (1 + document_frequency)) + 1
+        values = values * self.idf[indices[1]]
+        norms = torch.zeros(len(df)).index_add_(0, indices[0], values ** 2).sqrt().clamp(min=1e-12)
+        values = values / norms[indices[0]]
+        return torch.sparse_coo_tensor(indices, values, (len(df), self.n_features)).coalesce()
+
+    def _logits(self, features, green):
+        return torch.sparse.mm(features, self.weights.unsqueeze(1)).squeeze(1) + self.bias + self.green_weight * green
+
+    def fit(self, df, labels, epochs=200, lr=0.1, l2=1e-4):
+        """labels - 1 для 'да', 0 для 'нет'"""
+        features = self._features(df, fit=True)
+        green = self._green_counts(df)
+        targets = torch.tensor(np.asarray(labels, dtype=np.float32))
+        self.weights = torch.zeros(self.n_features, requires_grad=True)
+        self.bias = torch.zeros(1, requires_grad=True)
+        self.green_weight = torch.zeros(1, requires_grad=True)
+        optimizer = torch.optim.Adam([self.weights, self.bias, self.green_weight], lr=lr)
+        for _ in range(epochs):
+            optimizer.zero_grad()
+            loss = torch.nn.functional.binary_cross_entropy_with_logits(self._logits(features, green), targets)
+            loss = loss + l2 * self.weights.pow(2).sum()
+            loss.backward()
+            optimizer.step()
+        self.weights = self.weights.detach()
+        self.bias = self.bias.detach()
+        self.green_weight = self.green_weight.detach()
+        logger.info(f"Предклассификатор обучен на {len(df)} строках, loss {loss.item():.4f}")
+        return self
+
+    def validate(self, df, labels, threshold=0.5):
+        """Проверка на отложенных строках: доля уверенных и согласие их меток с labels"""
+        probabilities = self.predict_proba(df)
+        labels = np.asarray(labels)
+        confident = (probabilities <= self.low) | (probabilities >= self.high)
+        self.coverage = float(confident.mean()) if len(labels) else 0.0
+        agreement = (probabilities >= threshold) == labels
+        self.agreement = float(agreement[confident].mean()) if confident.any() else float("nan")
+        logger.info(f"Предклассификатор на проверке: {len(labels)} строк, уверенных {self.coverage:.1%}, "
+                    f"согласие с языковой моделью {self.agreement:.1%}")
+        return self
+
+    @classmethod
+    def from_classified(cls, path, threshold=0.5, validation=0.2, seed=0, **kwargs):
+        """
+        Обучение по разметке прошлого запуска (classified_output.csv). Метки берутся из ответов
+        языковой модели (llm_confidence), а не из собственных ответов первого уровня.
+        Доля validation строк откладывается для validate.
+        """
+        previous = read_table(path)
+        if 'llm_confidence' in previous.columns:
+            previous = previous[previous['llm_confidence'].notna()]
+            labels = (previous['llm_confidence'] >= threshold).astype(int).to_numpy()
+        else:
+            # Старый формат: ответ модели есть только у строк, не решённых первым уровнем
+            previous = previous[previous['classification'].isin(["да", "нет"])]
+            if 'tier' in previous.columns:
+                previous = previous[previous['tier'] != "pre"]
+            labels = (previous['classification'] == "да").astype(int).to_numpy()
+
+        order = np.random.default_rng(seed).permutation(len(previous))
+        held_out, train = order[:int(len(order) * validation)], order[int(len(order) * validation):]
+        if len(np.unique(labels[train])) < 2:
+            return None
+        pre_classifier = cls(**kwargs).fit(previous.iloc[train], labels[train])
+        return pre_classifier.validate(previous.iloc[held_out], labels[held_out], threshold)
+
+    def predict_proba(self, df):
+        with torch.inference_mode():
+            return torch.sigmoid(self._logits(self._features(df), self._green_counts(df))).numpy()
+
+
+def tiered_score(df, pre_classifier, score_rows, audit=0.05, threshold=0.5, seed=None):
+    """
+    Уверенные строки решает PreClassifier, остальные score_rows(df) (языковая модель).
+    Доля audit уверенных строк тоже уходит в языковую модель: они пополняют разметку
+    для следующего обучения и показывают согласие уровней на текущих данных.
+    Возвращает вероятности 'да' и признак, что строка ушла в языковую модель.
+    """
+    start = time.perf_counter()
+    probabilities = pre_classifier.predict_proba(df).astype(np.float64)
+    pre_time = time.perf_counter() - start
+
+    uncertain = (probabilities > pre_classifier.low) & (probabilities < pre_classifier.high)
+    audited = ~uncertain & (np.random.default_rng(seed).random(len(df)) < audit)
+    escalated = uncertain | audited
+    pre_labels = probabilities[audited] >= threshold
+    start = time.perf_counter()
+    if escalated.any():
+        probabilities[escalated] = score_rows(df[escalated])
+    llm_time = time.perf_counter() - start
+
+    total_time = pre_time + llm_time
+    report = (f"Предклассификатор: решено {len(df) - escalated.sum()} из {len(df)} строк, "
+              f"в языковую модель ушло {escalated.mean() if len(df) else 0:.1%}")
+    if audited.any():
+        agreement = (pre_labels == (probabilities[audited] >= threshold)).mean()
+        report += f", из них {audited.sum()} на проверку (согласие {agreement:.1%})"
+    if escalated.any() and total_time > 0:
+        # Оценка времени, если бы все строки шли через языковую модель
+        llm_only_time = llm_time / escalated.sum() * len(df)
+        report += (f"; {len(df) / total_time:.1f} строк/с против ~{len(df) / llm_only_time:.1f} строк/с "
+                   f"без первого уровня (x{llm_only_time / total_time:.1f})")
+    logger.info(report)
+    return probabilities, escalated
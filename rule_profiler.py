@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from pattern_matcher import PatternMatcher
+
+
+class RuleProfiler:
+    """
+    Статистика по каждому шаблону набора правил: сколько строк он находит, сколько строк
+    удалил только он и сколько времени заняла его регулярка. Каждый шаблон прогоняется
+    отдельно по тем же строкам, что проверяет стадия, без литерального префильтра,
+    поэтому время показывает собственную цену регулярки.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, stage: str, matcher: PatternMatcher, values):
+        values = [value for value in values if isinstance(value, str)]
+        hits = np.zeros((len(values), len(matcher)), dtype=bool)
+        seconds = np.zeros(len(matcher))
+        for pattern_id, compiled in enumerate(matcher.compiled):
+            search = compiled.search
+            start = time.perf_counter()
+            hits[:, pattern_id] = [search(value) is not None for value in values]
+            seconds[pattern_id] = time.perf_counter() - start
+
+        only = hits & (hits.sum(axis=1) == 1)[:, None]
+        matrix = hits.astype(np.int64)
+        self._add(stage, matcher.patterns, {
+            "rows": len(values),
+            "matches": hits.sum(axis=0),
+            "only": only.sum(axis=0),
+            "seconds": seconds,
+            "both": matrix.T @ matrix,
+        })
+
+    def _add(self, stage: str, patterns, counts: dict):
+        key = (stage, tuple(patterns))
+        if key not in self.stats:
+            self.stats[key] = counts
+            return
+        for name, value in counts.items():
+            self.stats[key][name] = self.stats[key][name] + value
+
+    def merge(self, other: "RuleProfiler"):
+        """Добавляет статистику другого профилировщика (например, из процесса-обработчика)"""
+        for (stage, patterns), counts in other.stats.items():
+            self._add(stage, patterns, counts)
+
+    def report(self, overlap: float = 0.9, slow_factor: float = 5.0) -> pd.DataFrame:
+        """
+        Таблица по шаблонам с пометками в столбце issues:
+        dead - ни одного совпадения, covered by #N - все совпадения шаблона находит и шаблон N
+        (удаление ничего не изменит), overlaps #N - ни один не покрывает другой целиком,
+        но общая доля совпадений не меньше overlap,
+        slow - время больше slow_factor медиан по стадии.
+        """
+        rows = []
+        for (stage, patterns), counts in self.stats.items():
+            matches, both = counts["matches"], counts["both"]
+            median_seconds = np.median(counts["seconds"])
+            for i, pattern in enumerate(patterns):
+                issues = []
+                if matches[i] == 0:
+                    issues.append("dead")
+                for j in range(len(patterns)):
+                    if j == i or both[i, j] == 0:
+                        continue
+                    if both[i, j] == matches[i] and (matches[i] < matches[j] or i > j):
+                        issues.append(f"covered by #{j}")
+                    elif overlap * min(matches[i], matches[j]) <= both[i, j] < min(matches[i], matches[j]):
+                        issues.append(f"overlaps #{j}")
+                if median_seconds > 0 and counts["seconds"][i] > slow_factor * median_seconds:
+                    issues.append("slow")
+                rows.append({
+                    "stage": stage,
+                    "pattern_id": i,
+                    "pattern": pattern,
+                    "matches": int(matches[i]),
+                    "only_removed": int(counts["only"][i]),
+                    "seconds": float(counts["seconds"][i]),
+                    "us_per_row": counts["seconds"][i] / counts["rows"] * 1e6 if counts["rows"] else 0.0,
+                    "issues": ", ".join(issues),
+                })
+        return pd.DataFrame(rows, columns=["stage", "pattern_id", "pattern", "matches", "only_removed",
+                                           "seconds", "us_per_row", "issues"])
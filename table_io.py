@@ -0,0 +1,139 @@
+import csv
+import os
+
+import pandas as pd
+
+# Столбцы с небольшим числом повторяющихся значений хранятся как категории
+CATEGORICAL_COLUMNS = ("query", "city")
+
+CSV_OPTIONS = {"sep": "|", "encoding": "utf-8-sig", "quoting": csv.QUOTE_ALL}
+
+
+def table_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".feather", ".arrow"):
+        return "feather"
+    return "csv"
+
+
+def with_categories(df: pd.DataFrame) -> pd.DataFrame:
+    columns = [column for column in CATEGORICAL_COLUMNS if column in df.columns and df[column].dtype != "category"]
+    if not columns:
+        return df
+    return df.astype({column: "category" for column in columns})
+
+
+def read_table(path: str, columns=None) -> pd.DataFrame:
+    """
+    Чтение промежуточного файла конвейера: Parquet, Feather/Arrow или CSV с '|'.
+    columns ограничивает чтение нужными столбцами.
+    """
+    file_format = table_format(path)
+    if file_format == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    if file_format == "feather":
+        return with_categories(pd.read_feather(path, columns=columns))
+    df = pd.read_csv(path, sep="|", usecols=columns)
+    return with_categories(df)
+
+
+def iter_table(path: str, chunksize: int, columns=None):
+    """Чтение файла частями по chunksize строк"""
+    file_format = table_format(path)
+    if file_format == "csv":
+        for chunk in pd.read_csv(path, sep="|", usecols=columns, chunksize=chunksize):
+            yield with_categories(chunk)
+        return
+
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+
+    if file_format == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns)
+        for batch in batches:
+            yield batch.to_pandas()
+        return
+    with ipc.open_file(path) as reader:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            yield with_categories(batch.to_pandas())
+
+
+class TableWriter:
+    """
+    Запись кадра по частям в один файл. Для Parquet и Feather каждая часть
+    становится группой строк или пакетом записей, CSV дописывается без заголовка.
+    """
+
+    def __init__(self, path: str, file_format: str = None):
+        self.path = path
+        self.format = file_format or table_format(path)
+        self.rows = 0
+        self._started = False
+        self._writer = None
+        self._schema = None
+
+    def _file_field(self, field):
+        """Тип столбца, под который подойдут и следующие части"""
+        import pyarrow as pa
+
+        # Столбец из одних пропусков получает тип null, в схеме файла делаем его строковым
+        if pa.types.is_null(field.type):
+            return field.with_type(pa.string())
+        if pa.types.is_dictionary(field.type):
+            # Файл Arrow IPC не допускает разных словарей в пакетах, категории восстанавливаются при чтении
+            if self.format == "feather":
+                return field.with_type(field.type.value_type)
+            # Ширина индексов категорий зависит от их числа в части, фиксируем int32
+            return field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        return field
+
+    def write(self, df: pd.DataFrame):
+        if self.format == "csv":
+            df.to_csv(self.path, index=False, mode="a" if self._started else "w", header=not self._started,
+                      **CSV_OPTIONS)
+            self._started = True
+            self.rows += len(df)
+            return
+
+        import pyarrow as pa
+
+        if self._writer is None:
+            # Текстовый столбец, пустой во всей первой части, pandas читает как float64 из NaN.
+            # Передаём его как null, чтобы в схему файла он попал строковым, а не double
+            empty = [column for column in df.columns if df[column].dtype.kind == "f" and df[column].isna().all()]
+            df = df.assign(**{column: pd.Series(None, index=df.index, dtype=object) for column in empty})
+        table = pa.Table.from_pandas(with_categories(df), preserve_index=False)
+        if self._writer is None:
+            self._schema = pa.schema([self._file_field(field) for field in table.schema], metadata=table.schema.metadata)
+            table = table.cast(self._schema)
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                import pyarrow.ipc as ipc
+                self._writer = ipc.new_file(self.path, self._schema)
+        else:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_table(df: pd.DataFrame, path: str, file_format: str = None):
+    with TableWriter(path, file_format) as writer:
+        writer.write(df)
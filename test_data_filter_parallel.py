@@ -0,0 +1,33 @@
+import logging
+
+import pandas as pd
+
+from benchmark import GREEN_FLAGS, synthetic_frame
+from DataFilter import RED_FLAGS, DataFilter
+
+
+def data_filter(df, **kwargs):
+    result = DataFilter(df, **kwargs)
+    result.logger.setLevel(logging.WARNING)
+    return result
+
+
+def test_apply_all_parallel_matches_serial():
+    df = synthetic_frame(3_000, seed=1)
+    serial = data_filter(df, red_flags=RED_FLAGS)
+    parallel = data_filter(df, red_flags=RED_FLAGS)
+    expected = serial.apply_all()
+    result = parallel.apply_all_parallel(workers=2, shard_size=700)
+    assert 700 < len(result) < len(df)
+    pd.testing.assert_frame_equal(result, expected)
+    pd.testing.assert_frame_equal(parallel.removed, serial.removed)
+
+
+def test_green_flags_count_with_workers_matches_serial():
+    df = synthetic_frame(3_000, seed=2)
+    serial = data_filter(df, green_flags=GREEN_FLAGS)
+    parallel = data_filter(df, green_flags=GREEN_FLAGS)
+    serial.get_green_flags_count()
+    parallel.get_green_flags_count(workers=2, shard_size=700)
+    assert serial.df["green_flags_count"].sum() > 0
+    pd.testing.assert_frame_equal(parallel.df, serial.df)
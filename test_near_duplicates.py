@@ -0,0 +1,50 @@
+import pandas as pd
+
+from DataFilter import DataFilter
+from near_duplicates import minhash_signatures, near_duplicate_pairs, shingles
+
+
+def jaccard(first, second):
+    first, second = set(shingles(first)), set(shingles(second))
+    return len(first & second) / len(first | second)
+
+
+def estimate(signatures):
+    return (signatures[0] == signatures[1]).mean()
+
+
+def test_dissimilar_texts_get_low_estimate():
+    texts = [
+        "Ubuy Казахстан - оптовый поставщик обуви и кроссовок с доставкой по всей стране",
+        "В Петропавловске с первого июня повышается стоимость проезда в городских автобусах",
+    ]
+    signatures = minhash_signatures(texts, num_perm=128)
+    assert jaccard(*texts) < 0.05
+    assert estimate(signatures) < 0.15
+    assert list(near_duplicate_pairs(signatures, bands=32)) == []
+
+
+def test_estimate_tracks_jaccard_of_similar_texts():
+    texts = [
+        "Оптовые поставщики обуви для маркетплейсов, база проверенных производителей",
+        "Оптовые поставщики кроссовок для маркетплейсов, база проверенных производителей",
+    ]
+    signatures = minhash_signatures(texts, num_perm=256)
+    assert abs(estimate(signatures) - jaccard(*texts)) < 0.1
+
+
+def test_identical_texts_are_paired():
+    texts = ["Дистрибьютор обуви в Ташкенте", "дистрибьютор  обуви в ташкенте", "Аренда спецтехники"]
+    assert list(near_duplicate_pairs(minhash_signatures(texts))) == [(0, 1)]
+
+
+def test_shared_hosts_are_not_collapsed_by_domain():
+    df = pd.DataFrame({
+        "url": ["https://t.me/obuv_optom", "https://t.me/kurtki_kz", "https://shop.kz/", "https://shop.kz/contacts"],
+        "title": ["Обувь оптом", "Куртки в Алматы", "Магазин обуви", "Контакты"],
+        "description": ["Канал поставщика обуви", "Верхняя одежда", "Каталог обуви", "Адрес и телефон"],
+    })
+    data_filter = DataFilter(df)
+    data_filter.drop_near_duplicates(by_domain=True)
+    assert data_filter.df["url"].tolist() == ["https://t.me/obuv_optom", "https://t.me/kurtki_kz", "https://shop.kz/"]
+    assert data_filter.removed["removed_pattern"].tolist() == ["same domain"]
@@ -0,0 +1,55 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import GREEN_FLAGS
+from DataFilter import RED_FLAGS
+from pattern_matcher import PatternMatcher
+
+EDGE_CASES = [
+    "",
+    "ОПТОВЫЙ ПРОДАВЕЦ ОБУВИ",
+    "Оптовые   Поставщики кроссовок",
+    "https://www.top.kz/catalog",
+    "https://market.sello.uz/ru",
+    "10 июня на рынке",
+    "Производители и поставщики оборудования",
+    "магазинчик у дома",
+    "İstanbul ayakkabı toptan",
+    "дистрибьюторы\nи дилеры",
+]
+
+
+def texts():
+    df = pd.read_csv(os.path.join(os.path.dirname(__file__), "filtered_output.csv"), sep="|")
+    values = pd.concat([df["url"], df["title"], df["description"]]).fillna("").astype(str)
+    return values.tolist() + EDGE_CASES
+
+
+def contains(values, pattern):
+    """Прежний путь: str.contains по каждому шаблону отдельно"""
+    return pd.Series(values).str.contains(pattern, flags=re.IGNORECASE, regex=True, na=False).to_numpy()
+
+
+@pytest.mark.parametrize("flags", [RED_FLAGS, GREEN_FLAGS], ids=["red", "green"])
+def test_matches_agree_with_str_contains(flags):
+    values = texts()
+    for column, patterns in flags.items():
+        matcher = PatternMatcher(patterns)
+        expected = np.column_stack([contains(values, pattern) for pattern in patterns])
+        hits = np.zeros_like(expected)
+        for row, pattern_ids in enumerate(matcher.all_matches(values)):
+            hits[row, pattern_ids] = True
+        assert (hits == expected).all(), column
+
+        first = np.array(matcher.first_matches(values))
+        expected_first = np.where(expected.any(axis=1), expected.argmax(axis=1), -1)
+        assert (first == expected_first).all(), column
+
+
+def test_non_strings_never_match():
+    matcher = PatternMatcher(RED_FLAGS["title"])
+    assert matcher.first_matches([None, np.nan, 5]) == [-1, -1, -1]
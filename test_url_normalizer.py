@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from url_normalizer import clean_url, normalize_urls, registrable_domain
+
+EDGE_CASES = [
+    None,
+    np.nan,
+    "",
+    "   ",
+    "nan",
+    "ftp://files.example.uz/price.xls",
+    "javascript:void(0)",
+    "http://",
+    "HTTP://WWW.Example.COM/Path/",
+    "https://www.shop.uz/",
+    "https://shop.uz//catalog//",
+    "  https://www.shop.kz/obuv  ",
+    "https://shop.kz/obuv?utm_source=google#contacts",
+    "https://shop.kz/obuv;jsessionid=1",
+    "https://user@www.shop.kz:8080/obuv",
+    "https://www.shop.kz/%D0%BE%D0%B1%D1%83%D0%B2%D1%8C/",
+    "https://www.shop.kz/%20obuv%20/",
+    "https://shop.kz/ob uv",
+    "https://shop\u200b.kz/obuv\ufeff",
+    "https://магазин.рф/Обувь/",
+    "https://sub.www.shop.com.uz/a",
+    "https://shop.co.uk/",
+    "www.shop.kz/obuv",
+]
+
+
+def urls():
+    df = pd.read_csv(os.path.join(os.path.dirname(__file__), "filtered_output.csv"), sep="|")
+    return pd.concat([df["url"], pd.Series(EDGE_CASES, dtype=object)], ignore_index=True)
+
+
+def test_normalize_urls_matches_clean_url():
+    values = urls()
+    normalized = normalize_urls(values)
+    expected = [clean_url(url) for url in values.astype(str)]
+    assert normalized["url"].tolist() == expected
+    assert normalized["domain"].tolist() == [registrable_domain(url) for url in expected]
+    assert (normalized.index == values.index).all()
+
+
+def test_clean_url_edge_cases():
+    assert clean_url("HTTP://WWW.Example.COM/Path/") == "http://example.com/path"
+    assert clean_url("https://shop.kz/obuv?utm_source=google#contacts") == "https://shop.kz/obuv"
+    assert clean_url("https://www.shop.kz/%20obuv%20/") == "https://shop.kz/obuv"
+    assert clean_url("ftp://files.example.uz/price.xls") == ""
+    assert clean_url("www.shop.kz/obuv") == ""
+    assert registrable_domain("https://sub.shop.com.uz/a") == "shop.com.uz"
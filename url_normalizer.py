@@ -0,0 +1,90 @@
+import re
+import urllib.parse
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+URL_CACHE_SIZE = 1 << 18
+
+# Простые адреса без процентного кодирования, пробелов и ;params,
+# для которых urlparse/urlunparse сводится к разбору одной регуляркой
+_SIMPLE_URL = r"^(https?)://([a-z0-9.\-_:@]+)(/[^?#;%\s\u200B-\u200D\uFEFF]*)?(?:[?#]\S*)?$"
+
+# Домены второго уровня, под которыми регистрируют сайты (co.uk, com.uz, ...)
+_SECOND_LEVEL = {"co", "com", "org", "net", "gov", "edu", "ac", "biz", "info"}
+
+# Площадки, на одном домене которых живут разные компании: мессенджеры и соцсети,
+# каталоги и доски объявлений, реестры, СМИ. Строки такого домена не считаются
+# копиями одной компании. Список неполный, поэтому схлопывание по домену по умолчанию выключено.
+SHARED_HOSTS = frozenset({
+    "t.me", "wa.me", "vk.com", "instagram.com", "facebook.com", "youtube.com", "viber.com", "ok.ru",
+    "2gis.kz", "2gis.ru", "yandex.kz", "yandex.ru", "google.com", "wikipedia.org",
+    "pulscen.kz", "prg.kz", "bizorg.su", "1cbit.kz", "salexy.kz", "orgs.biz", "yopt.org", "satu.kz",
+    "statsnet.co", "spr.kz", "i-r.kz", "kompra.kz", "cityinfo.kz", "ruspravochnik.com", "biznesinfo.kz",
+    "firma777.kz", "blizko.kz", "optof.biz", "supl.biz", "b2b.trade", "made-in-china.com", "sdelka.kz",
+    "avizinfo.kz", "vsesdelki.kz", "freeads.kz", "lalafo.kg", "olx.kz", "kaspi.kz", "flagma.kz",
+    "cenotavr.kz", "qoovee.com", "3klik.kz", "kurs.kz", "ismet.kz",
+    "atameken.kz", "gov.kz", "goszakup.gov.kz", "domkadrov.kz", "gorodrabot.kz", "jooble.org", "hh.kz",
+    "inform.kz", "zakon.kz", "tengrinews.kz", "inbusiness.kz", "kapital.kz", "forbes.kz", "kursiv.media",
+})
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def clean_url(url: str) -> str:
+    if not isinstance(url, str):
+        return ""
+    url = urllib.parse.unquote(url.strip().lower())
+    parsed = urllib.parse.urlparse(url)
+
+    # Пропускаем невалидные схемы
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return ""
+
+    cleaned_url = urllib.parse.urlunparse((
+        parsed.scheme,
+        parsed.netloc.replace("www.", ""),
+        parsed.path.rstrip("/"),
+        '', '', ''
+    ))
+    cleaned_url = re.sub(r"\s+", "", cleaned_url)
+    cleaned_url = re.sub(r"[\u200B-\u200D\uFEFF]", "", cleaned_url)
+    return cleaned_url
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def registrable_domain(url: str) -> str:
+    """Домен, под которым зарегистрирован сайт: shop.example.com.uz -> example.com.uz"""
+    if not url:
+        return ""
+    host = urllib.parse.urlsplit(url).netloc.rsplit("@", 1)[-1].split(":", 1)[0]
+    labels = [label for label in host.split(".") if label]
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def normalize_urls(urls: pd.Series) -> pd.DataFrame:
+    """
+    Нормализует столбец адресов так же, как clean_url, и возвращает кадр
+    со столбцами url и domain. Каждый уникальный адрес обрабатывается один раз:
+    простые адреса строковыми операциями pandas, остальные через clean_url.
+    """
+    codes, uniques = pd.factorize(urls.astype(str))
+    uniques = pd.Series(uniques, dtype=object)
+
+    parts = uniques.str.lower().str.extract(_SIMPLE_URL)
+    simple = parts[0].notna().to_numpy()
+    cleaned = np.empty(len(uniques), dtype=object)
+    cleaned[simple] = (
+        parts.loc[simple, 0] + "://"
+        + parts.loc[simple, 1].str.replace("www.", "", regex=False)
+        + parts.loc[simple, 2].fillna("").str.rstrip("/")
+    ).to_numpy()
+    cleaned[~simple] = [clean_url(url) for url in uniques[~simple]]
+    domains = np.array([registrable_domain(url) for url in cleaned], dtype=object)
+
+    # factorize помечает пропуски кодом -1, они становятся пустым адресом
+    cleaned = np.append(cleaned, "")
+    domains = np.append(domains, "")
+    return pd.DataFrame({"url": cleaned[codes], "domain": domains[codes]}, index=urls.index)
@@ -1,22 +1,198 @@
-import requests, time, json
+import requests, time, json, os, re, sqlite3, threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-with open("token.txt", "r") as file:
-    abstract_api = file.readline()
+# token.txt лежит рядом с модулем, чтобы импорт работал из любого рабочего каталога
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "token.txt"), "r") as file:
+    abstract_api = file.readline().strip()
+
+# Код страны, длина национального номера и префиксы национальных номеров
+COUNTRY_RULES = {
+    "UZ": ("998", 9, None),
+    "KG": ("996", 9, None),
+    "TJ": ("992", 9, None),
+    "KZ": ("7", 10, ("6", "7")),
+    "RU": ("7", 10, ("3", "4", "8", "9")),
+}
+
+
+def normalize_phone(phone: str, default_country: str = "UZ"):
+    """
+    Офлайн-приведение номера к E.164 (+998901234567) без обращения к API.
+    Возвращает None для мусора: неверной длины, без кода страны и т.п.
+    """
+    if not isinstance(phone, str):
+        return None
+    digits = re.sub(r"\D", "", phone)
+    if not digits:
+        return None
+    code, length, _ = COUNTRY_RULES.get(default_country, ("", 0, None))
+    if not phone.strip().startswith("+") and code:
+        if code == "7" and len(digits) == 11 and digits[0] == "8":
+            digits = "7" + digits[1:]
+        elif len(digits) == length:
+            digits = code + digits
+    for country, (code, length, _) in COUNTRY_RULES.items():
+        if digits.startswith(code) and len(digits) == len(code) + length:
+            return "+" + digits
+    # Номера других стран не разбираем, но оставляем проверку API, если длина допустима для E.164
+    if 8 <= len(digits) <= 15:
+        return "+" + digits
+    return None
+
+
+def phone_country(e164: str):
+    """Страна по коду номера, None если по префиксу её не определить"""
+    digits = e164.lstrip("+")
+    for country, (code, length, prefixes) in COUNTRY_RULES.items():
+        if digits.startswith(code) and len(digits) == len(code) + length:
+            if prefixes is None or digits[len(code)] in prefixes:
+                return country
+    return None
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AbstractApiValidator:
+    """Проверка через phonevalidation.abstractapi.com с общим пулом соединений и ограничением частоты"""
+
+    def __init__(self, api_key: str = abstract_api, session: requests.Session = None, rate: float = 5.0,
+                 timeout: float = 10, base_url: str = "https://phonevalidation.abstractapi.com/v1/",
+                 pool_size: int = 8):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session = session
+
+    def __call__(self, phone_number: str) -> tuple:
+        self.limiter.wait()
+        response = self.session.get(self.base_url, params={"api_key": self.api_key, "phone": phone_number},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        content = json.loads(response.content)
+        valid = content["valid"] or False
+        country = content["country"]["code"] or None
+        return valid, country
+
+
+class PhoneCache:
+    """Результаты проверки номеров в SQLite, общие для всех запусков"""
+
+    def __init__(self, path: str = "phone_cache.sqlite"):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS phones (phone TEXT PRIMARY KEY, valid INTEGER, country TEXT, checked_at REAL)"
+        )
+        self.connection.commit()
+
+    def get_many(self, phones) -> dict:
+        found = {}
+        phones = list(phones)
+        for i in range(0, len(phones), 500):
+            chunk = phones[i:i + 500]
+            rows = self.connection.execute(
+                f"SELECT phone, valid, country FROM phones WHERE phone IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update({phone: (bool(valid), country) for phone, valid, country in rows})
+        return found
+
+    def put(self, phone: str, result: tuple):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO phones VALUES (?, ?, ?, ?)",
+                                    (phone, int(result[0]), result[1], time.time()))
+
+    def close(self):
+        self.connection.close()
+
+
+# Результат номера, который не удалось проверить ни с одной попытки
+UNVERIFIED = (None, None)
+
+
+def validate_many(phones, validator=None, cache: PhoneCache = None, default_country: str = "UZ",
+                  countries=None, max_workers: int = 8, retries: int = 3, backoff: float = 1.0) -> dict:
+    """
+    Проверка набора номеров: дубликаты схлопываются, мусор отсекается офлайн,
+    номера, чья страна по коду заведомо не входит в countries, не проверяются,
+    известные номера берутся из кэша, остальные проверяются параллельно через validator.
+    validator - любой вызываемый объект phone -> (valid, country), например заглушка в тестах.
+    Ошибка validator (таймаут, 429, 5xx) повторяется до retries раз с паузой backoff, 2*backoff, ...
+    Возвращает словарь исходный номер -> (valid, country); для номеров, которые так и не удалось
+    проверить, valid равен None - такой номер не считается ни верным, ни неверным.
+    """
+    validator = validator or AbstractApiValidator()
+    normalized = {phone: normalize_phone(phone, default_country) for phone in set(phones)}
+    unparsed_count = sum(e164 is None for e164 in normalized.values())
+    unique = {e164 for e164 in normalized.values() if e164 is not None}
+    results = {}
+    if countries is not None:
+        for e164 in unique:
+            country = phone_country(e164)
+            if country is not None and country not in countries:
+                results[e164] = (False, country)
+    offline_count = len(results)
+    if cache is not None:
+        results.update(cache.get_many(unique - results.keys()))
+    pending = sorted(unique - results.keys())
+    # Разные записи одного номера ("+998 90...", "90...") после приведения к E.164 проверяются один раз
+    merged_count = len(normalized) - unparsed_count - len(unique)
+    print(f"Phones: {len(normalized)} unique, {merged_count} merged as duplicates, "
+          f"{unparsed_count + offline_count} rejected offline, "
+          f"{len(unique) - len(pending) - offline_count} cached, {len(pending)} to check")
+
+    def check(e164):
+        for attempt in range(retries):
+            try:
+                return e164, validator(e164)
+            except Exception as e:
+                print(f"Validation of {e164} failed (attempt {attempt + 1} of {retries}): {e}")
+                if attempt + 1 < retries:
+                    time.sleep(backoff * 2 ** attempt)
+        return e164, UNVERIFIED
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for e164, result in pool.map(check, pending):
+            results[e164] = result
+            if cache is not None and result is not UNVERIFIED:
+                cache.put(e164, result)
+    unverified_count = sum(results[e164] is UNVERIFIED for e164 in pending)
+    print(f"Phones: {len(pending) - unverified_count} checked, {unverified_count} unverified")
+
+    return {phone: results.get(e164, (False, None)) if e164 is not None else (False, None)
+            for phone, e164 in normalized.items()}
 
 
 def validate(phone_number: str) -> tuple:
-    response = requests.get(f"https://phonevalidation.abstractapi.com/v1/?api_key=48297372e15c45818930d5d70fb4b83f&phone={phone_number}")
-    content =  json.loads(response.content)
-    valid = content["valid"] or False
-    country = content["country"]["code"] or None
-    return valid, country
+    return AbstractApiValidator()(phone_number)
 
-def check_phones(phone_numbers: str, country: str) -> str:
+def check_phones(phone_numbers: str, country: str, results: dict = None) -> str:
     phones = phone_numbers.split(", ")
+    if results is None:
+        results = validate_many(phones, default_country=country)
     result = ""
     for phone in phones:
-        cur_valid, cur_country = validate(phone)
+        cur_valid, cur_country = results.get(phone, (False, None))
+        if cur_valid is None:
+            # Не проверен из-за ошибок API - неверным не считается
+            continue
         if not cur_valid or country != cur_country:
             if len(result) == 0:
                 result += phone
@@ -24,8 +200,29 @@ def check_phones(phone_numbers: str, country: str) -> str:
                 result += ", " + phone
     return result
 
+def check_database(input_path: str = "database.csv", output_path: str = "database_checked.csv",
+                   cache_path: str = "phone_cache.sqlite") -> int:
+    """Проверяет телефоны базы компаний и сохраняет её со столбцом invalid_phones, возвращает число строк"""
+    companies_base = pd.read_csv(input_path)
+    contacts = companies_base["contact"].fillna("")
+    cache = PhoneCache(cache_path)
+    validator = AbstractApiValidator()
+    # Национальные номера без кода дополняются кодом страны компании, поэтому результат
+    # одной и той же записи номера зависит от страны и хранится отдельно для каждой
+    results = {}
+    for country, group in contacts.groupby(companies_base["base"]):
+        phones = [phone for contact in group for phone in contact.split(", ") if phone]
+        results[country] = validate_many(phones, validator=validator, cache=cache,
+                                         default_country=country, countries={country})
+    cache.close()
+    companies_base["invalid_phones"] = [check_phones(contact, country, results.get(country, {}))
+                                        for contact, country in zip(contacts, companies_base["base"])]
+    companies_base.to_csv(output_path, index=False)
+    return len(companies_base)
+
+
 def main():
-    companies_base = pd.read_csv("database.csv").loc[:, ["base", "contact"]]
+    check_database()
 
 
 if __name__ == "__main__":